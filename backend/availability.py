@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+
+from backend.storage.base import RESERVED_FIELDS, reservation_id
+
+logger = logging.getLogger(__name__)
+
+# Users the filters are sized for before a rebuild grows them, and the
+# false-positive rate they are sized to
+CAPACITY = int(os.environ.get("AVAILABILITY_CAPACITY", "100000"))
+ERROR_RATE = float(os.environ.get("AVAILABILITY_ERROR_RATE", "0.01"))
+# Seconds between rebuilds from the datastore, which pick up users
+# registered through other workers
+REFRESH_INTERVAL = float(os.environ.get("AVAILABILITY_REFRESH_INTERVAL", "300"))
+
+# Query parameter -> reservation collection
+FIELDS = {field: collection for collection, field in RESERVED_FIELDS.items()}
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    `k` bit positions per item come from one blake2b digest via double
+    hashing. Lookups never give false negatives; false positives occur at
+    about `error_rate` once `capacity` items are added.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def expected_error_rate(self):
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class AvailabilityIndex:
+    """Answers "is this username / email free?" for signup forms.
+
+    A value missing from the Bloom filter is definitely free and is answered
+    from memory. A possible hit is confirmed with a point read of its
+    reservation, since it may be a false positive.
+    """
+
+    def __init__(self, get_storage, capacity=CAPACITY, error_rate=ERROR_RATE, refresh_interval=REFRESH_INTERVAL):
+        self.get_storage = get_storage
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.filters = {collection: BloomFilter(capacity, error_rate) for collection in RESERVED_FIELDS}
+        self.loaded_at = None
+        # Users added while a rebuild awaits the datastore, added again to the
+        # rebuilt filters; None when no rebuild is running
+        self._pending = None
+        self._load_lock = asyncio.Lock()
+        self._task = None
+        self.checks = 0
+        self.filter_misses = 0  # answered "free" without a read
+        self.point_reads = 0
+        self.false_positives = 0  # filter hits whose reservation didn't exist
+
+    def add(self, user):
+        if self._pending is not None:
+            self._pending.append(user)
+        for collection, field in RESERVED_FIELDS.items():
+            self.filters[collection].add(reservation_id(collection, user.get(field)))
+
+    def load(self, users):
+        # Leave headroom so registrations until the next rebuild stay within capacity
+        capacity = max(self.capacity, 2 * len(users))
+        self.filters = {collection: BloomFilter(capacity, self.error_rate) for collection in RESERVED_FIELDS}
+        for user in users:
+            self.add(user)
+        self.loaded_at = time.monotonic()
+
+    async def ensure_loaded(self):
+        """Build the filters on first use; rebuilds after that happen in the
+        background task, off the request path."""
+        if self.loaded_at is not None:
+            return
+        async with self._load_lock:
+            if self.loaded_at is None:
+                await self._reload()
+
+    async def refresh(self):
+        async with self._load_lock:
+            await self._reload()
+
+    async def _reload(self):
+        self._pending = []
+        try:
+            users = await self.get_storage().list_users(fields=list(RESERVED_FIELDS.values()))
+        finally:
+            pending, self._pending = self._pending, None
+        # A user missing from the new filters would be reported as available
+        self.load(users + pending)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            if self.loaded_at is None:
+                continue
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Availability refresh failed; serving the previous filters")
+
+    def start(self):
+        if self.refresh_interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def is_available(self, field, value):
+        collection = FIELDS[field]
+        value_id = reservation_id(collection, value)
+        self.checks += 1
+        if value_id not in self.filters[collection]:
+            self.filter_misses += 1
+            return True
+        self.point_reads += 1
+        holder = await self.get_storage().get_reservation(collection, value_id)
+        if holder is None:
+            self.false_positives += 1
+        return holder is None
+
+    def stats(self):
+        free = self.filter_misses + self.false_positives
+        return {
+            "checks": self.checks,
+            "answered_from_filter": self.filter_misses,
+            "point_reads": self.point_reads,
+            "false_positives": self.false_positives,
+            # Share of free values the filter failed to rule out
+            "observed_false_positive_rate": round(self.false_positives / free, 6) if free else None,
+            "expected_false_positive_rate": {
+                RESERVED_FIELDS[collection]: round(bloom.expected_error_rate(), 6)
+                for collection, bloom in self.filters.items()
+            },
+            "items": {RESERVED_FIELDS[collection]: bloom.count for collection, bloom in self.filters.items()},
+            "size_bytes": sum(len(bloom.bits) for bloom in self.filters.values()),
+        }
@@ -0,0 +1,162 @@
+import asyncio
+
+from backend.pagination import encode_cursor
+from backend.storage.base import COMMENT_SORT_FIELDS, comment_cursor, comment_ranks
+
+# Defaults for comment pages: top-level comments per page, how many levels
+# of replies to include, and how many replies to load under each of them
+DEFAULT_COMMENT_LIMIT = 20
+DEFAULT_REPLY_DEPTH = 2
+DEFAULT_REPLIES_PER_THREAD = 10
+MAX_REPLY_DEPTH = 8
+DEFAULT_SORT = "best"
+
+
+def path_segment(comment):
+    # Timestamps first so sibling paths sort oldest first
+    return f"{comment['created_at']}_{comment['id']}"
+
+
+def materialize_path(comment, parent=None):
+    """Set `path` and `depth` on a new comment. A comment's path is its
+    parent's path plus its own segment, so a whole thread is one range of
+    paths and sorting by path walks the thread depth first."""
+    if parent is None:
+        comment["path"] = path_segment(comment)
+        comment["depth"] = 0
+    else:
+        parent_path = parent.get("path") or path_segment(parent)
+        comment["path"] = f"{parent_path}/{path_segment(comment)}"
+        comment["depth"] = parent.get("depth", 0) + 1
+    comment["reply_count"] = 0
+    return comment
+
+
+def is_comment_cursor(cursor, sort):
+    # [path] for "old"/"new", [value, path] for "top"/"best"
+    if not isinstance(cursor, list) or len(cursor) != (2 if sort in COMMENT_SORT_FIELDS else 1):
+        return False
+    if not isinstance(cursor[-1], str):
+        return False
+    if sort in COMMENT_SORT_FIELDS:
+        return isinstance(cursor[0], (int, float)) and not isinstance(cursor[0], bool)
+    return True
+
+
+async def _load_thread_by_path(storage, post_id, child, depth, replies_per_thread):
+    # One range scan over the thread, already in depth-first "old" order
+    descendants = await storage.list_comment_descendants(
+        post_id, child["path"], child.get("depth", 0) + depth, replies_per_thread
+    )
+    nodes = {child["id"]: child}
+    for comment in descendants:
+        comment["replies"] = []
+        nodes[comment["id"]] = comment
+        parent = nodes.get(comment.get("parent_id"))
+        if parent is not None:
+            parent["replies"].append(comment)
+
+
+async def _load_thread_sorted(storage, post_id, child, depth, replies_per_thread, sort):
+    # Level by level from the per-parent sorted reply lists, so the replies
+    # kept under the budget are the highest ranked ones
+    budget = replies_per_thread
+    level = [child]
+    for _ in range(depth):
+        level = [node for node in level if node.get("reply_count")]
+        if not level or budget <= 0:
+            break
+        pages = await asyncio.gather(*(
+            storage.list_child_comments(post_id, node["id"], budget, None, sort) for node in level
+        ))
+        next_level = []
+        for node, page in zip(level, pages):
+            page = page[:budget]
+            budget -= len(page)
+            for comment in page:
+                comment["replies"] = []
+            node["replies"] = page
+            next_level.extend(page)
+        level = next_level
+
+
+def _mark_more_replies(comment, sort):
+    loaded = len(comment["replies"])
+    comment["more_replies"] = comment.get("reply_count", 0) > loaded
+    comment["replies_cursor"] = (
+        encode_cursor(comment_cursor(comment["replies"][-1], sort)) if comment["more_replies"] and loaded else None
+    )
+    for reply in comment["replies"]:
+        _mark_more_replies(reply, sort)
+
+
+async def load_comment_page(storage, post_id, parent_id, limit, after, depth, replies_per_thread, sort=DEFAULT_SORT):
+    """Load one page of the children of `parent_id` (None for top-level
+    comments) in `sort` order, with up to `depth` levels of replies under
+    each and at most `replies_per_thread` replies per child.
+
+    Every node gets "replies", "more_replies" (whether it has replies that
+    were not loaded) and "replies_cursor" (where to resume loading them via
+    /comments/{id}/replies with the same sort). Returns (comments,
+    next_cursor).
+    """
+    children = await storage.list_child_comments(post_id, parent_id, limit + 1, after, sort)
+    next_cursor = None
+    if len(children) > limit:
+        children = children[:limit]
+        next_cursor = encode_cursor(comment_cursor(children[-1], sort))
+
+    for child in children:
+        child["replies"] = []
+    threads = [child for child in children if child.get("reply_count")] if depth > 0 else []
+    if sort == "old":
+        await asyncio.gather(*(_load_thread_by_path(storage, post_id, child, depth, replies_per_thread) for child in threads))
+    else:
+        await asyncio.gather(*(_load_thread_sorted(storage, post_id, child, depth, replies_per_thread, sort) for child in threads))
+    for child in children:
+        _mark_more_replies(child, sort)
+    return children, next_cursor
+
+
+def backfill_paths(storage):
+    """Give comments written before paths existed a path, depth,
+    reply_count and sort fields. Returns the number of comments updated."""
+    updated = 0
+    for post in storage.list_posts():
+        comments = storage.list_comments_by_post(post["id"])
+        by_id = {comment["id"]: comment for comment in comments}
+        reply_counts = {}
+        for comment in comments:
+            if comment.get("parent_id"):
+                reply_counts[comment["parent_id"]] = reply_counts.get(comment["parent_id"], 0) + 1
+
+        def resolve(comment):
+            if comment.get("path") is None:
+                parent = by_id.get(comment.get("parent_id"))
+                materialize_path(comment, resolve(parent) if parent else None)
+            return comment
+
+        for comment in comments:
+            had_path = comment.get("path") is not None
+            ranks = comment_ranks(comment.get("upvotes", 0), comment.get("downvotes", 0))
+            resolve(comment)
+            if (
+                not had_path
+                or comment.get("reply_count") != reply_counts.get(comment["id"], 0)
+                or any(comment.get(field) != value for field, value in ranks.items())
+            ):
+                storage.update_comment(comment["id"], dict(
+                    ranks,
+                    path=comment["path"],
+                    depth=comment["depth"],
+                    reply_count=reply_counts.get(comment["id"], 0),
+                ))
+                updated += 1
+    return updated
+
+
+if __name__ == "__main__":
+    # python -m backend.comments: backfill materialized paths
+    from backend.database import get_storage
+
+    print(f"Updated {backfill_paths(get_storage())} comments")
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Shards per counter; each shard takes writes independently, so a counter
+# sustains roughly NUM_SHARDS times the single-document write rate
+NUM_SHARDS = int(os.environ.get("COUNTER_SHARDS", "10"))
+# Seconds between folds of the shards this worker wrote into the documents.
+# Overlay reads the shards, so this only bounds how stale a document's own
+# field gets; every fold is a write to the hot document, so keep it long.
+ROLLUP_INTERVAL = float(os.environ.get("COUNTER_ROLLUP_INTERVAL", "60.0"))
+# Seconds overlay reuses a counter's shard sum for the same fold generation
+CACHE_TTL = float(os.environ.get("COUNTER_CACHE_TTL", "5.0"))
+CACHE_SIZE = 10000
+
+# Counters maintained by the API, by collection
+COUNTED_FIELDS = {
+    "communities": ("post_count", "member_count"),
+    "posts": ("comment_count",),
+}
+# Storage lookups for the documents holding each collection's counters
+_GETTERS = {"communities": "get_community", "posts": "get_post"}
+
+
+def counter_name(collection, doc_id, field):
+    return f"{collection}:{doc_id}:{field}"
+
+
+class ShardedCounters:
+    """Distributed counters for document fields like post_count.
+
+    A count is the document field plus the sum of the counter's shards.
+    Increments go to a random shard with an atomic increment, so concurrent
+    writers rarely touch the same document and never overwrite each other.
+    Every ROLLUP_INTERVAL seconds each worker folds the shards it wrote into
+    the document; the fold bumps counter_folds[field] on the document, which
+    overlay uses to tell whether a cached shard sum predates a fold.
+    """
+
+    def __init__(self, get_storage, num_shards=NUM_SHARDS, rollup_interval=ROLLUP_INTERVAL, cache_ttl=CACHE_TTL):
+        self.get_storage = get_storage
+        self.num_shards = num_shards
+        self.rollup_interval = rollup_interval
+        self.cache_ttl = cache_ttl
+        # (collection, doc_id, field) of counters this worker incremented since its last rollup
+        self.dirty = set()
+        # counter name -> (fold generation, shard sum, expires at)
+        self.cache = {}
+        self._task = None
+        self._rollup_lock = asyncio.Lock()
+        self._stats = {"rollups": 0, "rollup_failures": 0, "counters_folded": 0, "shard_reads": 0}
+
+    async def increment(self, collection, doc_id, field, amount=1):
+        name = counter_name(collection, doc_id, field)
+        await self.get_storage().increment_counter(name, random.randrange(self.num_shards), amount)
+        self.dirty.add((collection, doc_id, field))
+        cached = self.cache.get(name)
+        if cached is not None:
+            self.cache[name] = (cached[0], cached[1] + amount, cached[2])
+
+    async def get(self, collection, doc_id, field):
+        """Exact value: the document's field plus every worker's shards."""
+        storage = self.get_storage()
+        name = counter_name(collection, doc_id, field)
+        doc, shards = await asyncio.gather(
+            getattr(storage, _GETTERS[collection])(doc_id),
+            storage.get_counters([name], self.num_shards),
+        )
+        return (doc or {}).get(field, 0) + shards[name]
+
+    async def overlay(self, collection, docs):
+        """Add the shard sums to the counted fields of `docs` in place and drop
+        their counter_folds. Sums are cached for cache_ttl seconds, and only
+        while the document's fold generation matches, so shards another worker
+        has folded into the document are never counted twice."""
+        now = time.monotonic()
+        generations = {}
+        for doc in docs:
+            folds = doc.pop("counter_folds", None) or {}
+            for field in COUNTED_FIELDS[collection]:
+                generations[counter_name(collection, doc["id"], field)] = folds.get(field, 0)
+        stale = [
+            name for name, generation in generations.items()
+            if name not in self.cache or self.cache[name][0] != generation or self.cache[name][2] <= now
+        ]
+        if stale:
+            sums = await self.get_storage().get_counters(stale, self.num_shards)
+            self._stats["shard_reads"] += len(stale)
+            if len(self.cache) + len(stale) > CACHE_SIZE:
+                self.cache = {name: cached for name, cached in self.cache.items() if cached[2] > now}
+            for name in stale:
+                self.cache[name] = (generations[name], sums[name], now + self.cache_ttl)
+        for doc in docs:
+            for field in COUNTED_FIELDS[collection]:
+                doc[field] = (doc.get(field) or 0) + self.cache[counter_name(collection, doc["id"], field)][1]
+        return docs
+
+    async def rollup(self):
+        """Fold the shards of every counter this worker incremented into its
+        document. Returns the number of counters folded."""
+        async with self._rollup_lock:
+            dirty, self.dirty = self.dirty, set()
+            storage = self.get_storage()
+            folded = 0
+            for collection, doc_id, field in dirty:
+                name = counter_name(collection, doc_id, field)
+                try:
+                    await storage.fold_counter(name, collection, doc_id, field, self.num_shards)
+                except Exception:
+                    # Left in the shards, where overlay still counts it; retried next rollup
+                    self._stats["rollup_failures"] += 1
+                    self.dirty.add((collection, doc_id, field))
+                    logger.exception("Folding counter %s failed", name)
+                    continue
+                folded += 1
+            self._stats["rollups"] += 1
+            self._stats["counters_folded"] += folded
+            return folded
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.rollup_interval)
+            await self.rollup()
+
+    def start(self):
+        if self.rollup_interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        # Fold what this worker wrote so no delta is left behind in the shards
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.rollup()
+
+    def stats(self):
+        return {"dirty_counters": len(self.dirty), "cached_sums": len(self.cache), **self._stats}
+
+    async def reconcile(self):
+        """Recompute every counter from the source documents, write it to the
+        document and clear its shards. Returns the number of counters written."""
+        storage = self.get_storage()
+        written = 0
+        communities, posts = await asyncio.gather(storage.list_communities(), storage.list_posts())
+
+        post_counts = dict.fromkeys((community["id"] for community in communities), 0)
+        for post in posts:
+            if post.get("community_id") in post_counts:
+                post_counts[post["community_id"]] += 1
+        for community_id, count in post_counts.items():
+            await self._reset(storage.update_community, "communities", community_id, "post_count", count)
+            written += 1
+
+        for community in communities:
+            members = await storage.list_members(community["id"])
+            await self._reset(storage.update_community, "communities", community["id"], "member_count", len(members))
+            written += 1
+
+        for post in posts:
+            comments = await storage.list_comments_by_post(post["id"])
+            await self._reset(storage.update_post, "posts", post["id"], "comment_count", len(comments))
+            written += 1
+
+        self.dirty.clear()
+        self.cache.clear()
+        return written
+
+    async def recount_votes(self):
+        """Recompute every post's upvotes, downvotes and score from the vote
+        documents, repairing counts lost with a crashed worker's vote buffer.
+        Run it while no API worker is buffering votes, or their pending
+        deltas land on top of the recount. Returns the number of posts
+        corrected."""
+        storage = self.get_storage()
+        posts, votes = await asyncio.gather(storage.list_posts(), storage.list_votes())
+        tallies = {post["id"]: {"upvotes": 0, "downvotes": 0} for post in posts}
+        for vote in votes:
+            tally = tallies.get(vote.get("post_id"))
+            if tally is not None and vote.get("vote_type") in ("upvote", "downvote"):
+                tally[vote["vote_type"] + "s"] += 1
+        corrected = 0
+        for post in posts:
+            tally = tallies[post["id"]]
+            fields = dict(tally, score=tally["upvotes"] - tally["downvotes"])
+            if any(post.get(field, 0) != value for field, value in fields.items()):
+                await storage.update_post(post["id"], fields)
+                corrected += 1
+        return corrected
+
+    async def _reset(self, update, collection, doc_id, field, value):
+        await self.get_storage().set_counter(counter_name(collection, doc_id, field), 0, self.num_shards)
+        await update(doc_id, {field: value})
+
+
+if __name__ == "__main__":
+    # python -m backend.counters: rebuild all counters from source data
+    from backend.database import get_async_storage
+
+    async def main():
+        counters = ShardedCounters(get_async_storage)
+        return await counters.reconcile(), await counters.recount_votes()
+
+    count, corrected = asyncio.run(main())
+    print(f"Reconciled {count} counters, recounted votes on {corrected} posts")
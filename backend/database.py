@@ -1,7 +1,138 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import os
+import threading
+import time
 
-cred = credentials.Certificate(r"C:\Users\Faleel Mohsin\Documents\claude\backend\serviceAccountKey.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
-users_collection = db.collection("users")
\ No newline at end of file
+from backend.storage import STORAGE_ENGINE, create_async_storage, create_storage
+
+# Path to the Firebase service account key
+CREDENTIALS_PATH = os.environ.get(
+    "FIREBASE_CREDENTIALS", r"C:\Users\Faleel Mohsin\Documents\claude\backend\serviceAccountKey.json"
+)
+
+# Startup timings reported by /metrics
+timings = {}
+
+_lock = threading.RLock()
+_db = None
+_async_db = None
+_storage = None
+_async_storage = None
+
+
+def _init_firebase():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        started = time.perf_counter()
+        cred = credentials.Certificate(CREDENTIALS_PATH)
+        firebase_admin.initialize_app(cred)
+        timings["firebase_init_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+
+def _client_args():
+    # Our own clients rather than firebase_admin's cached ones, so
+    # close_storage() can close them without breaking a later get
+    import firebase_admin
+
+    _init_firebase()
+    app = firebase_admin.get_app()
+    return {"project": app.project_id, "credentials": app.credential.get_credential()}
+
+
+def get_db():
+    """Return the shared synchronous Firestore client behind the legacy
+    routes' users_collection, initializing Firebase on first use."""
+    global _db
+    if _db is None:
+        with _lock:
+            if _db is None:
+                from google.cloud.firestore import Client
+
+                _db = Client(**_client_args())
+    return _db
+
+
+def get_async_db():
+    """Return the shared Firestore AsyncClient used by the API handlers."""
+    global _async_db
+    if _async_db is None:
+        with _lock:
+            if _async_db is None:
+                _async_db = _new_async_db()
+    return _async_db
+
+
+def _new_async_db():
+    """Return a Firestore AsyncClient of its own.
+
+    The sync engine needs one because an AsyncClient's gRPC channel belongs
+    to the event loop it is first used on: the sync engine runs on a private
+    loop, while the API (and the CLIs' asyncio.run) use another, so they
+    can't share get_async_db(). The API process never builds the sync
+    engine, so it holds a single client."""
+    from google.cloud.firestore import AsyncClient
+
+    return AsyncClient(**_client_args())
+
+
+def get_storage():
+    """Return the shared storage engine selected by CAMPUS_STORAGE."""
+    global _storage
+    if _storage is None:
+        client = _new_async_db if STORAGE_ENGINE == "firestore" else None
+        with _lock:
+            if _storage is None:
+                started = time.perf_counter()
+                _storage = create_storage(client=client)
+                timings["storage_init_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return _storage
+
+
+def get_async_storage():
+    """Return the shared async storage engine used by the API handlers.
+
+    Non-Firestore engines wrap the same instance get_storage() returns, so
+    sync tooling and the API see one datastore.
+    """
+    global _async_storage
+    if _async_storage is None:
+        if STORAGE_ENGINE == "firestore":
+            client, sync_storage = get_async_db(), None
+        else:
+            client, sync_storage = None, get_storage()
+        with _lock:
+            if _async_storage is None:
+                started = time.perf_counter()
+                _async_storage = create_async_storage(client=client, sync_storage=sync_storage)
+                timings["async_storage_init_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return _async_storage
+
+
+async def close_storage():
+    """Close the storage engines and every Firestore client this process
+    opened."""
+    global _db, _async_db, _storage, _async_storage
+    with _lock:
+        storage, async_storage, db = _storage, _async_storage, _db
+        _db = _async_db = _storage = _async_storage = None
+    if async_storage is not None:
+        # Closes the AsyncClient, or the sync engine an adapter wraps
+        await async_storage.close()
+    if storage is not None and storage is not getattr(async_storage, "engine", None):
+        storage.close()
+    if db is not None:
+        db.close()
+
+
+class LazyCollection:
+    """Firestore collection reference that resolves the client on first use."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db().collection(self.name), attr)
+
+
+users_collection = LazyCollection("users")
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+
+# Open event streams per worker; further connections get a 503
+MAX_CONNECTIONS = int(os.environ.get("LIVE_MAX_CONNECTIONS", "1000"))
+# Posts one connection may watch
+MAX_POSTS_PER_CONNECTION = int(os.environ.get("LIVE_MAX_POSTS_PER_CONNECTION", "100"))
+# Seconds between keepalive comments on an idle stream, so proxies don't
+# close it and disconnected clients are noticed
+KEEPALIVE_INTERVAL = float(os.environ.get("LIVE_KEEPALIVE_INTERVAL", "15"))
+# Milliseconds browsers wait before reconnecting a dropped stream
+RECONNECT_DELAY_MS = 3000
+
+
+class Subscription:
+    """One client's stream: the posts it watches and the changes not yet
+    sent to it.
+
+    Changes are merged per post rather than queued, so a slow client gets
+    the latest counts once it catches up and holds at most one pending
+    entry per watched post, however many writes happen meanwhile.
+    """
+
+    def __init__(self, post_ids):
+        self.post_ids = frozenset(post_ids)
+        self.pending = {}  # post_id -> {field: latest value}
+        self.ready = asyncio.Event()
+
+    def push(self, post_id, counts):
+        """Queue `counts` for `post_id`; returns True if it replaced an
+        unsent change instead of adding one."""
+        merged = post_id in self.pending
+        self.pending.setdefault(post_id, {}).update(counts)
+        self.ready.set()
+        return merged
+
+    async def changes(self, timeout):
+        """Wait up to `timeout` seconds for changes and take them all;
+        returns {} if nothing changed."""
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self.ready.clear()
+        changes, self.pending = self.pending, {}
+        return changes
+
+
+class LiveCounts:
+    """In-process pub/sub of post counter changes behind /live/posts.
+
+    The vote and comment handlers publish each post's new upvotes,
+    downvotes or comment_count; every open stream watching that post gets
+    the fields that changed. Only writes handled by this worker are seen.
+    """
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_posts=MAX_POSTS_PER_CONNECTION):
+        self.max_connections = max_connections
+        self.max_posts = max_posts
+        self.watchers = defaultdict(set)  # post_id -> subscriptions
+        self.connections = 0
+        self.rejected = 0
+        self.published = 0
+        self.delivered = 0
+        self.merged = 0
+
+    @property
+    def full(self):
+        return self.connections >= self.max_connections
+
+    def watched(self, post_id):
+        """Whether any stream watches `post_id`, so publishers can skip
+        work nobody will see."""
+        return post_id in self.watchers
+
+    def reject(self):
+        """Count a stream turned away because this worker is full."""
+        self.rejected += 1
+
+    def subscribe(self, post_ids):
+        subscription = Subscription(post_ids)
+        for post_id in subscription.post_ids:
+            self.watchers[post_id].add(subscription)
+        self.connections += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for post_id in subscription.post_ids:
+            watchers = self.watchers.get(post_id)
+            if watchers is not None:
+                watchers.discard(subscription)
+                if not watchers:
+                    del self.watchers[post_id]
+        self.connections -= 1
+
+    def publish(self, post_id, **counts):
+        self.published += 1
+        for subscription in self.watchers.get(post_id, ()):
+            if subscription.push(post_id, counts):
+                self.merged += 1
+            else:
+                self.delivered += 1
+
+    async def stream(self, post_ids, is_disconnected, snapshot):
+        """Server-Sent Events for `post_ids`: one "counts" event per post from
+        `await snapshot()`, then one per changed post.
+
+        The subscription is made when the body starts, so a response that is
+        never sent holds no slot, and before the snapshot is read, so no
+        change made in between is missed. It is released however the stream
+        ends."""
+        yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+        if self.full:
+            # Others subscribed since the handler checked; the client retries
+            self.reject()
+            return
+        subscription = self.subscribe(post_ids)
+        try:
+            for counts in await snapshot():
+                yield _event(counts)
+            while not await is_disconnected():
+                changes = await subscription.changes(KEEPALIVE_INTERVAL)
+                if not changes:
+                    yield ": keepalive\n\n"
+                    continue
+                yield "".join(_event({"post_id": post_id, **counts}) for post_id, counts in changes.items())
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "watched_posts": len(self.watchers),
+            "rejected": self.rejected,
+            "published": self.published,
+            "delivered": self.delivered,
+            # Changes folded into one still waiting to be sent to a slow client
+            "merged": self.merged,
+        }
+
+
+def _event(data):
+    return f"event: counts\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
@@ -1,20 +1,92 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
+import logging
+import os
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 import uuid
-import firebase_admin
-from firebase_admin import credentials, firestore
 from typing import List, Optional
 import hashlib
+from backend.availability import AvailabilityIndex
+from backend.comments import (
+    DEFAULT_COMMENT_LIMIT,
+    DEFAULT_REPLIES_PER_THREAD,
+    DEFAULT_REPLY_DEPTH,
+    DEFAULT_SORT,
+    MAX_REPLY_DEPTH,
+    is_comment_cursor,
+    load_comment_page,
+    materialize_path,
+)
+from backend.counters import ShardedCounters
+from backend.database import close_storage, get_async_storage, timings
+from backend.live import LiveCounts
+from backend.pagination import DEFAULT_LIMIT, MAX_LIMIT, decode_cursor, encode_cursor, project
+from backend.posts import is_post_cursor
+from backend.ranking import SORTS, WINDOWS, RankingEngine, is_feed_cursor
+from backend.response_cache import ResponseCache
+from backend.responses import CompressionMiddleware, FastJSONResponse, json_response
+from backend.search import SearchEngine, is_search_cursor
+from backend.security import shutdown_pool as shutdown_password_pool
+from backend.sessions import admin_user, current_user, sessions
+from backend.storage import ConflictError
+from backend.storage.base import COMMENT_SORTS
+from backend.typeahead import CommunityTypeahead
+from backend.vote_buffer import VoteAggregator
+
+logger = logging.getLogger(__name__)
 
-# Replace 'your-firebase-credentials.json' with your downloaded JSON key file
-cred = credentials.Certificate(r"C:\Users\Faleel Mohsin\Documents\claude\backend\serviceAccountKey.json")
-firebase_admin.initialize_app(cred)
+# Set CAMPUS_LAZY_INIT=1 to defer datastore setup to the first request
+# instead of doing it in the startup hook
+LAZY_INIT = os.environ.get("CAMPUS_LAZY_INIT", "0") == "1"
 
-# Firestore client
-db = firestore.client()
+# Responses are rendered with orjson; read handlers return json_response()
+# directly so large payloads also skip FastAPI's jsonable_encoder pass
+router = APIRouter(default_response_class=FastJSONResponse)
 
-app = FastAPI()
+# Cached responses of the hot read endpoints, invalidated by tag on writes
+response_cache = ResponseCache()
+# Coalesces post vote counter updates into periodic batched writes; cached
+# posts are dropped once their new counts are written
+vote_buffer = VoteAggregator(
+    get_async_storage,
+    on_flush=lambda post_ids: response_cache.invalidate(*(f"post:{post_id}" for post_id in post_ids)),
+)
+# post_count / comment_count take writes on sharded counters that a background
+# rollup folds into the documents
+counters = ShardedCounters(get_async_storage)
+# Precomputed Hot / New / Top / Rising feeds
+ranking = RankingEngine(get_async_storage)
+# Inverted index behind /search
+search_engine = SearchEngine(get_async_storage)
+SEARCH_KINDS = ("communities", "posts")
+# Counts /search reads from the documents rather than the index
+SEARCH_COUNT_FIELDS = {"communities": ("member_count", "post_count"), "posts": ("upvotes", "comment_count")}
+# Bloom filters over taken usernames / emails for the signup form
+availability = AvailabilityIndex(get_async_storage)
+# Prefix index over community names for pickers and duplicate checks
+typeahead = CommunityTypeahead(get_async_storage)
+# Pushes vote and comment count changes to /live/posts streams
+live = LiveCounts()
+
+# Orderings supported by /get_posts
+POST_ORDERS = ("created_at", "score")
+# Fields list views get by default
+POST_LIST_FIELDS = ["id", "title", "author", "community_name", "created_at", "upvotes", "comment_count", "preview"]
+# Fields /get_posts may be asked for: the Post schema, what create_post and
+# votes add, and the computed "preview"
+POST_FIELDS = {
+    "id", "title", "community_id", "community_name", "post_type", "author", "content", "url",
+    "description", "caption", "has_image", "poll_description", "poll_options", "poll_duration",
+    "poll_results", "tags", "created_at", "updated_at", "upvotes", "downvotes", "score",
+    "comment_count", "preview",
+}
 
 # Define User Schema
 class UserCreate(BaseModel):
@@ -56,41 +128,51 @@ class Comment(BaseModel):
     parent_id: Optional[str] = None  # For nested comments
 
 # Define Vote Schema
+# The voter comes from the session token; user_id is optional and, if
+# sent, must match it
 class Vote(BaseModel):
     post_id: str
-    user_id: str
+    user_id: Optional[str] = None
+    vote_type: str  # "upvote" or "downvote"
+
+class CommentVote(BaseModel):
+    comment_id: str
+    user_id: Optional[str] = None
+    vote_type: str  # "upvote" or "downvote"
+
+class VoteBatchItem(BaseModel):
+    post_id: str
     vote_type: str  # "upvote" or "downvote"
 
+class VoteBatch(BaseModel):
+    votes: List[VoteBatchItem]
+    user_id: Optional[str] = None
+
+# Define Batch Get Schema
+class BatchGet(BaseModel):
+    ids: List[str]
+
 # Hash password function
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-@app.post("/register", status_code=201)
-def register_user(user: UserCreate):
+@router.post("/register", status_code=201)
+async def register_user(user: UserCreate):
     try:
+        storage = get_async_storage()
         # Check if email ends with @rajalakshmi.edu.in
         if not user.email.endswith('@rajalakshmi.edu.in'):
             raise HTTPException(status_code=400, detail="Only @rajalakshmi.edu.in email addresses are allowed")
         
-        # Check if email already exists
-        existing_user_email = db.collection("users").where("email", "==", user.email).get()
-        if existing_user_email:
-            raise HTTPException(status_code=400, detail="Email already registered")
-        
-        # Check if username already exists
-        existing_user_username = db.collection("users").where("username", "==", user.username).get()
-        if existing_user_username:
-            raise HTTPException(status_code=400, detail="Username already taken")
-        
         # Generate unique User ID
         user_id = str(uuid.uuid4())
-        user_ref = db.collection("users").document(user_id)
         
         # Hash the password
         hashed_password = hash_password(user.password)
         
-        # Store user in Firestore
-        user_ref.set({
+        # Store user. The email and username are reserved in the same
+        # transaction, so two simultaneous signups can't both take them
+        user_data = {
             "id": user_id,
             "username": user.username,
             "email": user.email,
@@ -100,7 +182,13 @@ def register_user(user: UserCreate):
             "profile_picture": None,
             "bio": None,
             "joined_communities": []
-        })
+        }
+        try:
+            await storage.create_user(user_data)
+        except ConflictError as e:
+            detail = "Email already registered" if e.field == "email" else "Username already taken"
+            raise HTTPException(status_code=400, detail=detail)
+        availability.add(user_data)
         
         return {"message": "User registered successfully", "user_id": user_id}
     
@@ -109,6 +197,31 @@ def register_user(user: UserCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# End the session: the token stops working everywhere this worker checks it
+@router.post("/logout")
+async def logout(user: dict = Depends(current_user)):
+    sessions.revoke(user)
+    return {"message": "Logged out"}
+
+# Whether a username and/or email is still free, cheap enough to call on
+# every keystroke: most answers come from memory without a datastore read
+@router.get("/availability")
+async def check_availability(username: Optional[str] = None, email: Optional[str] = None):
+    try:
+        if not username and not email:
+            raise HTTPException(status_code=400, detail="Pass username and/or email")
+        await availability.ensure_loaded()
+        result = {}
+        if username:
+            result["username"] = {"value": username, "available": await availability.is_available("username", username)}
+        if email:
+            result["email"] = {"value": email, "available": await availability.is_available("email", email)}
+        return json_response(result)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Login endpoint
 class LoginRequest(BaseModel):
     email: str
@@ -119,24 +232,31 @@ def hash_password(password: str) -> str:
     return password  # Replace with real hash function
 
 # ✅ Fixed Login Endpoint
-@app.post("/login")
-def login_user(request: LoginRequest):
+@router.post("/login")
+async def login_user(request: LoginRequest):
     try:
+        storage = get_async_storage()
         # Get user by email
-        user_query = db.collection("users").where("email", "==", request.email).limit(1).get()
+        user_data = await storage.get_user_by_email(request.email)
         
-        if not user_query:
+        if not user_data:
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
-        user_data = user_query[0].to_dict()
-        
         # Check password
         hashed_password = hash_password(request.password)
         if user_data.get("password") != hashed_password:
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
-        # Return user info (excluding password)
+        # Return user info (excluding password) with a signed session token
+        # to send as "Authorization: Bearer <token>"
         user_info = {k: v for k, v in user_data.items() if k != "password"}
+        token, claims = sessions.issue(user_data)
+        user_info.update({
+            "user_id": user_data["id"],
+            "access_token": token,
+            "token_type": "bearer",
+            "expires_at": claims["exp"],
+        })
         return user_info
     
     except HTTPException as he:
@@ -144,20 +264,23 @@ def login_user(request: LoginRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/create_community")
-def create_community(community: Community):
+@router.post("/create_community")
+async def create_community(community: Community):
     try:
+        storage = get_async_storage()
         # Generate unique Community ID
         community_id = str(uuid.uuid4())
-        community_ref = db.collection("communities").document(community_id)
 
-        # Check if the community name already exists
-        existing_communities = db.collection("communities").where("name", "==", community.name).get()
-        if existing_communities:
+        # Check if the community name already exists: the prefix index catches
+        # names that only differ in case or spacing without a datastore read,
+        # the exact lookup covers communities other workers just created
+        await typeahead.ensure_loaded()
+        existing_community = typeahead.find_by_name(community.name) or await storage.get_community_by_name(community.name)
+        if existing_community:
             raise HTTPException(status_code=400, detail="Community name already exists")
 
-        # Store community details in Firestore
-        community_ref.set({
+        # Store community details
+        community_data = {
             "id": community_id,
             "name": community.name,
             "description": community.description,
@@ -165,28 +288,35 @@ def create_community(community: Community):
             "visibility": community.visibility,
             "adult_content": community.adult_content,
             "topics": community.topics,
-            "members": [community.created_by],  # Creator is the first member
             "moderators": [community.created_by],  # Creator is the first mod
             "created_at": datetime.utcnow().isoformat()
-        })
+        }
+        await storage.create_community(community_data)
+        # Creator is the first member
+        creator = await storage.get_user_by_email(community.created_by)
+        await _add_member(storage, community_id, community.created_by, creator)
+        search_engine.add("communities", community_data)
+        typeahead.add(dict(community_data, member_count=1))
+        response_cache.invalidate("communities")
         
         return {"message": "Community created successfully", "community_id": community_id}
     
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/create_post")
-def create_post(post: Post):
+@router.post("/create_post")
+async def create_post(post: Post):
     try:
+        storage = get_async_storage()
         # Generate unique Post ID
         post_id = str(uuid.uuid4())
-        post_ref = db.collection("posts").document(post_id)
         
         # Verify that the community exists
-        community_ref = db.collection("communities").document(post.community_id)
-        community = community_ref.get()
+        community_data = await storage.get_community(post.community_id)
         
-        if not community.exists:
+        if not community_data:
             raise HTTPException(status_code=404, detail="Community not found")
         
         # Prepare post data
@@ -198,6 +328,7 @@ def create_post(post: Post):
             "upvotes": 0,
             "downvotes": 0,
             "comment_count": 0,
+            "score": 0,
         })
         
         # Handle specific post types
@@ -206,13 +337,14 @@ def create_post(post: Post):
             poll_results = {option: 0 for option in post.poll_options}
             post_data["poll_results"] = poll_results
         
-        # Store post in Firestore
-        post_ref.set(post_data)
+        # Store post
+        await storage.create_post(post_data)
         
         # Update post count in community
-        community_data = community.to_dict()
-        current_post_count = community_data.get("post_count", 0)
-        community_ref.update({"post_count": current_post_count + 1})
+        await counters.increment("communities", post.community_id, "post_count")
+        ranking.add_post(post_data)
+        response_cache.invalidate("communities", f"community_posts:{post.community_id}")
+        search_engine.add("posts", post_data)
         
         return {"message": "Post created successfully", "post_id": post_id}
     
@@ -221,30 +353,32 @@ def create_post(post: Post):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/add_comment")
-def add_comment(comment: Comment):
+@router.post("/add_comment")
+async def add_comment(comment: Comment):
     try:
+        storage = get_async_storage()
         # Generate unique Comment ID
         comment_id = str(uuid.uuid4())
-        comment_ref = db.collection("comments").document(comment_id)
         
-        # Verify that the post exists
-        post_ref = db.collection("posts").document(comment.post_id)
-        post = post_ref.get()
+        # Verify that the post exists and, if it's a reply, that the parent
+        # comment exists (both lookups run concurrently)
+        if comment.parent_id:
+            post_data, parent_comment = await asyncio.gather(
+                storage.get_post(comment.post_id),
+                storage.get_comment(comment.parent_id),
+            )
+        else:
+            post_data, parent_comment = await storage.get_post(comment.post_id), None
         
-        if not post.exists:
+        if not post_data:
             raise HTTPException(status_code=404, detail="Post not found")
         
-        # If it's a reply, verify that the parent comment exists
         if comment.parent_id:
-            parent_comment_ref = db.collection("comments").document(comment.parent_id)
-            parent_comment = parent_comment_ref.get()
-            
-            if not parent_comment.exists:
+            if not parent_comment:
                 raise HTTPException(status_code=404, detail="Parent comment not found")
         
-        # Store comment in Firestore
-        comment_ref.set({
+        # Store comment with its materialized path in the thread
+        comment_data = materialize_path({
             "id": comment_id,
             "post_id": comment.post_id,
             "parent_id": comment.parent_id,
@@ -254,12 +388,23 @@ def add_comment(comment: Comment):
             "updated_at": datetime.utcnow().isoformat(),
             "upvotes": 0,
             "downvotes": 0,
-        })
+            "score": 0,
+            "best": 0.0,
+        }, parent_comment)
+        await storage.create_comment(comment_data)
         
-        # Update comment count in post
-        post_data = post.to_dict()
-        current_comment_count = post_data.get("comment_count", 0)
-        post_ref.update({"comment_count": current_comment_count + 1})
+        # Update comment count in post and reply count in the parent
+        if parent_comment:
+            await asyncio.gather(
+                counters.increment("posts", comment.post_id, "comment_count"),
+                storage.increment_comment_fields(comment.parent_id, {"reply_count": 1}),
+            )
+        else:
+            await counters.increment("posts", comment.post_id, "comment_count")
+        ranking.on_comment(comment.post_id)
+        response_cache.invalidate(f"post:{comment.post_id}")
+        if live.watched(comment.post_id):
+            live.publish(comment.post_id, comment_count=await counters.get("posts", comment.post_id, "comment_count"))
         
         return {"message": "Comment added successfully", "comment_id": comment_id}
     
@@ -267,186 +412,431 @@ def add_comment(comment: Comment):
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-@app.post("/vote")
-def vote(vote_data: Vote):
+@router.post("/vote")
+async def vote(vote_data: Vote, user: dict = Depends(current_user)):
     try:
-        # Check if post exists
-        post_ref = db.collection("posts").document(vote_data.post_id)
-        post = post_ref.get()
+        storage = get_async_storage()
+        if vote_data.vote_type not in ("upvote", "downvote"):
+            raise HTTPException(status_code=400, detail="vote_type must be 'upvote' or 'downvote'")
+        if vote_data.user_id and vote_data.user_id != user["sub"]:
+            raise HTTPException(status_code=403, detail="Cannot vote as another user")
 
-        if not post.exists:
+        # Record the vote in one transaction. With the vote buffer enabled the
+        # counter deltas are queued and flushed in batches; otherwise they are
+        # written in the same transaction. No re-read is needed either way.
+        result = await storage.apply_vote(
+            vote_data.post_id,
+            user["sub"],
+            vote_data.vote_type,
+            datetime.utcnow().isoformat(),
+            update_counters=not vote_buffer.enabled,
+        )
+
+        if result is None:
             raise HTTPException(status_code=404, detail="Post not found")
 
-        # Check if user has already voted
-        votes_ref = db.collection("votes")
-        existing_vote = votes_ref.where("post_id", "==", vote_data.post_id).where("user_id", "==", vote_data.user_id).get()
-
-        post_data = post.to_dict()
-        current_upvotes = post_data.get("upvotes", 0)
-        current_downvotes = post_data.get("downvotes", 0)
-
-        if existing_vote:
-            existing_vote_id = existing_vote[0].id
-            existing_vote_data = existing_vote[0].to_dict()
-            existing_vote_type = existing_vote_data.get("vote_type")
-
-            if existing_vote_type == vote_data.vote_type:
-                # User is removing their vote
-                if vote_data.vote_type == "upvote":
-                    post_ref.update({"upvotes": max(0, current_upvotes - 1)})
-                else:
-                    post_ref.update({"downvotes": max(0, current_downvotes - 1)})
-
-                votes_ref.document(existing_vote_id).delete()
-            else:
-                # User is switching their vote
-                if vote_data.vote_type == "upvote":
-                    post_ref.update({"upvotes": current_upvotes + 1, "downvotes": max(0, current_downvotes - 1)})
-                else:
-                    post_ref.update({"upvotes": max(0, current_upvotes - 1), "downvotes": current_downvotes + 1})
-
-                votes_ref.document(existing_vote_id).update({"vote_type": vote_data.vote_type, "updated_at": datetime.utcnow().isoformat()})
-        else:
-            # New vote
-            vote_id = str(uuid.uuid4())
-
-            if vote_data.vote_type == "upvote":
-                post_ref.update({"upvotes": current_upvotes + 1})
-            else:
-                post_ref.update({"downvotes": current_downvotes + 1})
-
-            votes_ref.document(vote_id).set({
-                "id": vote_id,
-                "post_id": vote_data.post_id,
-                "user_id": vote_data.user_id,
-                "vote_type": vote_data.vote_type,
-                "created_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            })
-
-        # Fetch the updated vote count after voting
-        updated_post = post_ref.get().to_dict()
-        return {
-            "upvotes": updated_post.get("upvotes", 0),
-            "downvotes": updated_post.get("downvotes", 0)
-        }
+        upvotes, downvotes = result["upvotes"], result["downvotes"]
+        if vote_buffer.enabled:
+            # Include other votes on this post that haven't been flushed yet
+            pending_upvotes, pending_downvotes = vote_buffer.pending_for(vote_data.post_id)
+            upvotes += pending_upvotes
+            downvotes += pending_downvotes
+            vote_buffer.add(vote_data.post_id, result["upvote_delta"], result["downvote_delta"])
+        ranking.on_vote(vote_data.post_id, result["upvote_delta"], result["downvote_delta"])
+        response_cache.invalidate(f"post:{vote_data.post_id}")
+        live.publish(vote_data.post_id, upvotes=max(0, upvotes), downvotes=max(0, downvotes))
+
+        return {"upvotes": max(0, upvotes), "downvotes": max(0, downvotes)}
 
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    
+
+# Apply a queue of votes from one user in a single transaction. Items are
+# applied in order, so voting the same way twice on a post still toggles.
+@router.post("/votes:batch")
+async def vote_batch(batch: VoteBatch, user: dict = Depends(current_user)):
+    try:
+        storage = get_async_storage()
+        if len(batch.votes) > MAX_LIMIT:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_LIMIT} votes per request")
+        for index, item in enumerate(batch.votes):
+            if item.vote_type not in ("upvote", "downvote"):
+                raise HTTPException(status_code=400, detail=f"votes[{index}]: vote_type must be 'upvote' or 'downvote'")
+        if batch.user_id and batch.user_id != user["sub"]:
+            raise HTTPException(status_code=403, detail="Cannot vote as another user")
+
+        results = await storage.apply_votes(
+            user["sub"],
+            [(item.post_id, item.vote_type) for item in batch.votes],
+            datetime.utcnow().isoformat(),
+            update_counters=not vote_buffer.enabled,
+        )
+
+        # Sum each post's deltas so the buffer, rankings and cache see one
+        # change per post
+        deltas = {}
+        for item, result in zip(batch.votes, results):
+            if result is not None:
+                upvote_delta, downvote_delta = deltas.get(item.post_id, (0, 0))
+                deltas[item.post_id] = (upvote_delta + result["upvote_delta"], downvote_delta + result["downvote_delta"])
+        # Votes on these posts not yet flushed, as in /vote
+        pending = {post_id: vote_buffer.pending_for(post_id) if vote_buffer.enabled else (0, 0) for post_id in deltas}
+        for post_id, (upvote_delta, downvote_delta) in deltas.items():
+            if vote_buffer.enabled:
+                vote_buffer.add(post_id, upvote_delta, downvote_delta)
+            ranking.on_vote(post_id, upvote_delta, downvote_delta)
+        if deltas:
+            response_cache.invalidate(*(f"post:{post_id}" for post_id in deltas))
+
+        items, posts = [], {}
+        for item, result in zip(batch.votes, results):
+            if result is None:
+                items.append({"post_id": item.post_id, "status": "not_found"})
+                continue
+            pending_upvotes, pending_downvotes = pending[item.post_id]
+            counts = {
+                "upvotes": max(0, result["upvotes"] + pending_upvotes),
+                "downvotes": max(0, result["downvotes"] + pending_downvotes),
+            }
+            items.append({"post_id": item.post_id, "status": "ok", "vote_type": result["vote_type"], **counts})
+            # The last item for a post leaves its final counts
+            posts[item.post_id] = counts
+        for post_id, counts in posts.items():
+            live.publish(post_id, **counts)
+
+        return {"results": items, "posts": posts}
+
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Vote on a comment; its "top" and "best" sort fields are updated in the
+# same transaction, so sorted reply lists stay current
+@router.post("/vote_comment")
+async def vote_comment(vote_data: CommentVote, user: dict = Depends(current_user)):
+    try:
+        storage = get_async_storage()
+        if vote_data.vote_type not in ("upvote", "downvote"):
+            raise HTTPException(status_code=400, detail="vote_type must be 'upvote' or 'downvote'")
+        if vote_data.user_id and vote_data.user_id != user["sub"]:
+            raise HTTPException(status_code=403, detail="Cannot vote as another user")
+
+        result = await storage.apply_comment_vote(
+            vote_data.comment_id,
+            user["sub"],
+            vote_data.vote_type,
+            datetime.utcnow().isoformat(),
+        )
+        if result is None:
+            raise HTTPException(status_code=404, detail="Comment not found")
+
+        response_cache.invalidate(f"post:{result['post_id']}")
+
+        return {"upvotes": result["upvotes"], "downvotes": result["downvotes"], "score": result["score"], "best": result["best"]}
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _conditional(request: Request, tags):
+    """ETag headers for a response built from `tags`, and a 304 to send
+    instead if the client's If-None-Match already names it (else None)."""
+    key = f"{request.url.path}?{sorted(request.query_params.multi_items())}"
+    etag = response_cache.etag(tags, key)
+    if etag is None:
+        return {}, None
+    # Clients may keep the response but must revalidate before reusing it
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if response_cache.matches(etag, request.headers.get("if-none-match")):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
 # Get all communities
-@app.get("/get_communities")
-def get_communities():
+@router.get("/get_communities")
+async def get_communities(request: Request):
+    try:
+        headers, not_modified = _conditional(request, ["communities"])
+        if not_modified:
+            return not_modified
+        storage = get_async_storage()
+
+        async def load():
+            communities = await storage.list_communities()
+            return await counters.overlay("communities", communities)
+
+        return json_response(await response_cache.get_or_load("get_communities", load, ["communities"]), headers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Get posts, newest or highest-scored first, one page at a time
+@router.get("/get_posts")
+async def get_posts(
+    request: Request,
+    limit: int = DEFAULT_LIMIT,
+    after: Optional[str] = None,
+    order_by: str = "created_at",
+    fields: Optional[str] = None,
+):
+    try:
+        storage = get_async_storage()
+        if order_by not in POST_ORDERS:
+            raise HTTPException(status_code=400, detail=f"order_by must be one of {', '.join(POST_ORDERS)}")
+        # Any post changing or being created can change any page
+        headers, not_modified = _conditional(request, ["post", "community_posts"])
+        if not_modified:
+            return not_modified
+        limit = max(1, min(limit, MAX_LIMIT))
+        try:
+            cursor = decode_cursor(after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if cursor is not None:
+            if not is_post_cursor(cursor, order_by):
+                raise HTTPException(status_code=400, detail="Cursor does not match order_by")
+            cursor = cursor[1:]
+
+        # "fields=all" returns whole documents; by default only what list views need
+        if fields == "all":
+            field_list = None
+        elif fields:
+            field_list = [field.strip() for field in fields.split(",") if field.strip()]
+            unknown = sorted(set(field_list) - POST_FIELDS)
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+            if not field_list:
+                raise HTTPException(status_code=400, detail="fields lists no field names")
+        else:
+            field_list = POST_LIST_FIELDS
+        storage_fields = None
+        if field_list is not None:
+            storage_fields = [field for field in field_list if field != "preview"]
+            if "preview" in field_list:
+                storage_fields.append("content")
+            if "comment_count" in field_list:
+                # Lets overlay tell whether its cached shard sums predate a fold
+                storage_fields.append("counter_folds")
+
+        # Fetch one extra post to learn whether there is a next page
+        posts = await storage.list_posts_page(order_by, limit + 1, after=cursor, fields=storage_fields)
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            last = posts[-1]
+            next_cursor = encode_cursor([order_by, last.get(order_by, 0 if order_by == "score" else ""), last["id"]])
+
+        if field_list is None or "comment_count" in field_list:
+            await counters.overlay("posts", posts)
+        if field_list is not None:
+            posts = [project(post, field_list) for post in posts]
+        return json_response({"posts": posts, "next_cursor": next_cursor}, headers)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Ranked feed: sort is hot, new, top or rising; window is day, week, month or all
+@router.get("/feed")
+async def feed(sort: str = "hot", window: str = "all", limit: int = DEFAULT_LIMIT, after: Optional[str] = None):
     try:
-        communities_ref = db.collection("communities").stream()
-        communities = [doc.to_dict() for doc in communities_ref]
-        return communities
+        if sort not in SORTS:
+            raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORTS)}")
+        if window not in WINDOWS:
+            raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}")
+        limit = max(1, min(limit, MAX_LIMIT))
+        try:
+            cursor = decode_cursor(after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if cursor is not None and not is_feed_cursor(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        await ranking.ensure_loaded()
+        posts, last_key = ranking.page(sort, window, limit, cursor)
+        return json_response({"posts": posts, "next_cursor": encode_cursor(last_key) if last_key else None})
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Get all posts
-@app.get("/get_posts")
-def get_posts():
+# Community name suggestions, most members first
+@router.get("/communities/typeahead")
+async def community_typeahead(q: str, k: int = 10):
     try:
-        posts_ref = db.collection("posts").stream()
-        posts = [doc.to_dict() for doc in posts_ref]
-        return posts
+        await typeahead.ensure_loaded()
+        return json_response(typeahead.complete(q, max(1, min(k, 50))))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Get posts by community
-@app.get("/get_community_posts/{community_id}")
-def get_community_posts(community_id: str):
+@router.get("/get_community_posts/{community_id}")
+async def get_community_posts(community_id: str, request: Request):
     try:
-        # Verify that the community exists
-        community_ref = db.collection("communities").document(community_id)
-        community = community_ref.get()
-        
-        if not community.exists:
-            raise HTTPException(status_code=404, detail="Community not found")
-        
-        # Get posts for this community
-        posts_ref = db.collection("posts").where("community_id", "==", community_id).stream()
-        posts = [doc.to_dict() for doc in posts_ref]
+        headers, not_modified = _conditional(request, [f"community_posts:{community_id}", "post"])
+        if not_modified:
+            return not_modified
+        storage = get_async_storage()
+
+        async def load():
+            # Verify that the community exists
+            community = await storage.get_community(community_id)
+            
+            if not community:
+                raise HTTPException(status_code=404, detail="Community not found")
+            
+            # Get posts for this community
+            posts = await storage.list_posts_by_community(community_id)
+            return await counters.overlay("posts", posts)
         
-        return posts
+        # Tagged with every post listed, so a vote or comment on any of them
+        # drops the cached list
+        posts = await response_cache.get_or_load(
+            f"get_community_posts:{community_id}",
+            load,
+            lambda posts: [f"community_posts:{community_id}"] + [f"post:{post['id']}" for post in posts],
+        )
+        return json_response(posts, headers)
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Get a single post with its comments
-@app.get("/get_post/{post_id}")
-def get_post(post_id: str):
+async def _comment_page(storage, post_id, parent_id, limit, after, depth, replies, sort):
+    if sort not in COMMENT_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(COMMENT_SORTS)}")
+    limit = max(1, min(limit, MAX_LIMIT))
+    depth = max(0, min(depth, MAX_REPLY_DEPTH))
+    replies = max(1, min(replies, MAX_LIMIT))
     try:
-        # Get the post
-        post_ref = db.collection("posts").document(post_id)
-        post = post_ref.get()
-        
-        if not post.exists:
-            raise HTTPException(status_code=404, detail="Post not found")
-        
-        post_data = post.to_dict()
-        
-        # Get comments for this post
-        comments_ref = db.collection("comments").where("post_id", "==", post_id).stream()
-        comments = [doc.to_dict() for doc in comments_ref]
-        
-        # Organize comments into a hierarchy
-        comment_dict = {comment["id"]: comment for comment in comments}
-        comment_tree = []
-        
-        for comment in comments:
-            if comment.get("parent_id") is None:
-                # This is a root comment
-                comment_tree.append(comment)
-            else:
-                # This is a reply
-                parent_id = comment.get("parent_id")
-                if parent_id in comment_dict:
-                    if "replies" not in comment_dict[parent_id]:
-                        comment_dict[parent_id]["replies"] = []
-                    comment_dict[parent_id]["replies"].append(comment)
-        
-        # Return post with its comments
-        return {
-            "post": post_data,
-            "comments": comment_tree
-        }
+        cursor = decode_cursor(after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if cursor is not None and not is_comment_cursor(cursor, sort):
+        raise HTTPException(status_code=400, detail=f"Cursor does not belong to sort={sort}")
+    return await load_comment_page(storage, post_id, parent_id, limit, cursor, depth, replies, sort)
+
+# Get a single post with the first page of its comment tree
+@router.get("/get_post/{post_id}")
+async def get_post(
+    post_id: str,
+    request: Request,
+    limit: int = DEFAULT_COMMENT_LIMIT,
+    depth: int = DEFAULT_REPLY_DEPTH,
+    replies: int = DEFAULT_REPLIES_PER_THREAD,
+    sort: str = DEFAULT_SORT,
+):
+    try:
+        headers, not_modified = _conditional(request, [f"post:{post_id}"])
+        if not_modified:
+            return not_modified
+        storage = get_async_storage()
+
+        async def load():
+            # Get the post and the first page of comments concurrently
+            post_data, (comments, next_cursor) = await asyncio.gather(
+                storage.get_post(post_id),
+                _comment_page(storage, post_id, None, limit, None, depth, replies, sort),
+            )
+            
+            if not post_data:
+                raise HTTPException(status_code=404, detail="Post not found")
+            
+            await counters.overlay("posts", [post_data])
+            
+            # Return post with its comments; the rest of the thread is loaded
+            # through /get_post/{post_id}/comments and /comments/{id}/replies
+            return {
+                "post": post_data,
+                "comments": comments,
+                "next_cursor": next_cursor,
+            }
+
+        post = await response_cache.get_or_load(
+            f"get_post:{post_id}:{limit}:{depth}:{replies}:{sort}", load, [f"post:{post_id}"]
+        )
+        return json_response(post, headers)
     
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Get a page of a post's top-level comments, each with its first replies
+@router.get("/get_post/{post_id}/comments")
+async def get_post_comments(
+    post_id: str,
+    limit: int = DEFAULT_COMMENT_LIMIT,
+    after: Optional[str] = None,
+    depth: int = DEFAULT_REPLY_DEPTH,
+    replies: int = DEFAULT_REPLIES_PER_THREAD,
+    sort: str = DEFAULT_SORT,
+):
+    try:
+        storage = get_async_storage()
+        comments, next_cursor = await _comment_page(storage, post_id, None, limit, after, depth, replies, sort)
+        return json_response({"comments": comments, "next_cursor": next_cursor})
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Get a page of replies to a comment ("load more replies")
+@router.get("/comments/{comment_id}/replies")
+async def get_comment_replies(
+    comment_id: str,
+    limit: int = DEFAULT_COMMENT_LIMIT,
+    after: Optional[str] = None,
+    depth: int = DEFAULT_REPLY_DEPTH,
+    replies: int = DEFAULT_REPLIES_PER_THREAD,
+    sort: str = DEFAULT_SORT,
+):
+    try:
+        storage = get_async_storage()
+        parent = await storage.get_comment(comment_id)
+        if not parent:
+            raise HTTPException(status_code=404, detail="Comment not found")
+        comments, next_cursor = await _comment_page(storage, parent["post_id"], comment_id, limit, after, depth, replies, sort)
+        return json_response({"comments": comments, "next_cursor": next_cursor})
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _add_member(storage, community_id, user_email, user_data):
+    # New members start with nothing unread
+    read_post_count = await counters.get("communities", community_id, "post_count")
+    joined = await storage.add_member(
+        community_id, user_email, user_data and user_data["id"], datetime.utcnow().isoformat(), read_post_count
+    )
+    if joined:
+        await counters.increment("communities", community_id, "member_count")
+    return joined
+
 # Join a community
-@app.post("/join_community/{community_id}")
-def join_community(community_id: str, user_email: str):
+@router.post("/join_community/{community_id}")
+async def join_community(community_id: str, user_email: str):
     try:
-        # Verify that the community exists
-        community_ref = db.collection("communities").document(community_id)
-        community = community_ref.get()
+        storage = get_async_storage()
+        # Verify that the community exists and find the user's account, if
+        # any, so its joined_communities can be kept in step
+        community_data, user_data = await asyncio.gather(
+            storage.get_community(community_id),
+            storage.get_user_by_email(user_email),
+        )
         
-        if not community.exists:
+        if not community_data:
             raise HTTPException(status_code=404, detail="Community not found")
         
-        community_data = community.to_dict()
-        current_members = community_data.get("members", [])
-        
-        # Check if user is already a member
-        if user_email in current_members:
+        # The membership document is created only if it doesn't exist yet, so
+        # concurrent joins can't overwrite each other or double count
+        if not await _add_member(storage, community_id, user_email, user_data):
             return {"message": "Already a member of this community"}
-        
-        # Add user to members
-        current_members.append(user_email)
-        community_ref.update({"members": current_members})
+        typeahead.set_member_count(community_id, await counters.get("communities", community_id, "member_count"))
+        # The user document lists joined communities
+        response_cache.invalidate("communities", *([f"user:{user_data['id']}"] if user_data else []))
         
         return {"message": "Successfully joined community"}
     
@@ -455,62 +845,326 @@ def join_community(community_id: str, user_email: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Leave a community
+@router.post("/leave_community/{community_id}")
+async def leave_community(community_id: str, user_email: str):
+    try:
+        storage = get_async_storage()
+        community_data, user_data = await asyncio.gather(
+            storage.get_community(community_id),
+            storage.get_user_by_email(user_email),
+        )
+        
+        if not community_data:
+            raise HTTPException(status_code=404, detail="Community not found")
+        
+        if not await storage.remove_member(community_id, user_email, user_data and user_data["id"]):
+            return {"message": "Not a member of this community"}
+        await counters.increment("communities", community_id, "member_count", -1)
+        typeahead.set_member_count(community_id, await counters.get("communities", community_id, "member_count"))
+        # The user document lists joined communities
+        response_cache.invalidate("communities", *([f"user:{user_data['id']}"] if user_data else []))
+        
+        return {"message": "Successfully left community"}
+    
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Get a user's joined communities
-@app.get("/get_user_communities/{user_email}")
-def get_user_communities(user_email: str):
+@router.get("/get_user_communities/{user_email}")
+async def get_user_communities(user_email: str):
     try:
+        storage = get_async_storage()
         # Get communities where user is a member
-        communities_ref = db.collection("communities").where("members", "array_contains", user_email).stream()
-        communities = [doc.to_dict() for doc in communities_ref]
+        communities = await storage.list_communities_for_member(user_email)
+        await counters.overlay("communities", communities)
         
-        return communities
+        return json_response(communities)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Get user profile
-@app.get("/get_user/{user_id}")
-def get_user(user_id: str):
+# A user's communities for the sidebar, most recently active first, with
+# how many posts each has had since the user last read it
+@router.get("/my_communities")
+async def my_communities(limit: int = 10, user: dict = Depends(current_user)):
     try:
-        user_ref = db.collection("users").document(user_id)
-        user = user_ref.get()
+        storage = get_async_storage()
+        limit = max(1, min(limit, MAX_LIMIT))
+        memberships = await storage.list_memberships_for_member(user["email"])
+        read_counts = {membership["community_id"]: membership.get("read_post_count", 0) for membership in memberships}
+        communities = await storage.get_communities(list(read_counts))
+        # Last activity is the newest post, read off the posts index rather
+        # than written to the community document on every post
+        newest = await asyncio.gather(*(
+            storage.list_posts_page("created_at", 1, community_id=community["id"], fields=["created_at"])
+            for community in communities
+        ))
+        for community, posts in zip(communities, newest):
+            community["last_activity_at"] = posts[0]["created_at"] if posts else community.get("created_at")
+        communities.sort(key=lambda community: community["last_activity_at"] or "", reverse=True)
+        communities = await counters.overlay("communities", communities[:limit])
         
-        if not user.exists:
-            raise HTTPException(status_code=404, detail="User not found")
+        return json_response({
+            "communities": [
+                {
+                    "id": community["id"],
+                    "name": community.get("name"),
+                    "member_count": community["member_count"],
+                    "unread_count": max(0, community["post_count"] - read_counts[community["id"]]),
+                    "last_activity_at": community.get("last_activity_at"),
+                }
+                for community in communities
+            ]
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Mark a community's posts as read for a member
+@router.post("/communities/{community_id}/read")
+async def mark_community_read(community_id: str, user: dict = Depends(current_user)):
+    try:
+        storage = get_async_storage()
+        user_email = user["email"]
+        if not await storage.get_membership(community_id, user_email):
+            raise HTTPException(status_code=404, detail="Not a member of this community")
+        post_count = await counters.get("communities", community_id, "post_count")
+        await storage.update_membership(community_id, user_email, {
+            "read_post_count": post_count,
+            "read_at": datetime.utcnow().isoformat(),
+        })
         
-        user_data = user.to_dict()
-        # Remove password from response
-        if "password" in user_data:
-            del user_data["password"]
+        return {"message": "Marked as read", "unread_count": 0}
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Get user profile
+@router.get("/get_user/{user_id}")
+async def get_user(user_id: str):
+    try:
+        storage = get_async_storage()
+
+        async def load():
+            user_data = await storage.get_user(user_id)
             
-        return user_data
+            if not user_data:
+                raise HTTPException(status_code=404, detail="User not found")
+            
+            # Remove password from response
+            if "password" in user_data:
+                del user_data["password"]
+                
+            return user_data
+
+        return json_response(await response_cache.get_or_load(f"get_user:{user_id}", load, [f"user:{user_id}"]))
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Search communities and posts
-@app.get("/search")
-def search(query: str):
+async def _batch_get(ids, fetch):
+    # Duplicates are fetched once; results keep the order of the request
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_LIMIT} ids per request")
+    found = {doc["id"]: doc for doc in await fetch(ids)}
+    return [found[doc_id] for doc_id in ids if doc_id in found], [doc_id for doc_id in ids if doc_id not in found]
+
+# Fetch specific posts, users or communities in one datastore round trip;
+# ids that don't exist are listed under "missing"
+@router.post("/posts:batchGet")
+async def batch_get_posts(request: BatchGet):
     try:
-        results = {
-            "communities": [],
-            "posts": []
-        }
+        storage = get_async_storage()
+        posts, missing = await _batch_get(request.ids, storage.get_posts)
+        await counters.overlay("posts", posts)
+        return json_response({"posts": posts, "missing": missing})
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/users:batchGet")
+async def batch_get_users(request: BatchGet):
+    try:
+        storage = get_async_storage()
+        users, missing = await _batch_get(request.ids, storage.get_users)
+        # Remove passwords from response
+        for user in users:
+            user.pop("password", None)
+        return json_response({"users": users, "missing": missing})
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/communities:batchGet")
+async def batch_get_communities(request: BatchGet):
+    try:
+        storage = get_async_storage()
+        communities, missing = await _batch_get(request.ids, storage.get_communities)
+        await counters.overlay("communities", communities)
+        return json_response({"communities": communities, "missing": missing})
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _live_counts(post):
+    # Same counts /vote reports, unflushed votes included
+    pending_upvotes, pending_downvotes = vote_buffer.pending_for(post["id"])
+    return {
+        "post_id": post["id"],
+        "upvotes": max(0, post.get("upvotes", 0) + pending_upvotes),
+        "downvotes": max(0, post.get("downvotes", 0) + pending_downvotes),
+        "comment_count": post.get("comment_count", 0),
+    }
+
+# Live vote and comment counts for up to LIVE_MAX_POSTS_PER_CONNECTION posts
+# (?ids=a,b,c) as Server-Sent Events. The stream opens with the current
+# counts, then sends a "counts" event with the changed fields of a post
+# whenever it is voted on or commented.
+@router.get("/live/posts")
+async def live_posts(request: Request, ids: str):
+    try:
+        post_ids = list(dict.fromkeys(post_id for post_id in ids.split(",") if post_id))
+        if not post_ids:
+            raise HTTPException(status_code=400, detail="Pass at least one post id")
+        if len(post_ids) > live.max_posts:
+            raise HTTPException(status_code=400, detail=f"At most {live.max_posts} posts per connection")
+        if live.full:
+            live.reject()
+            raise HTTPException(status_code=503, detail="Too many live connections", headers={"Retry-After": "5"})
+
+        storage = get_async_storage()
+
+        async def snapshot():
+            posts = await counters.overlay("posts", await storage.get_posts(post_ids))
+            return [_live_counts(post) for post in posts]
+
+        return StreamingResponse(
+            live.stream(post_ids, request.is_disconnected, snapshot),
+            media_type="text/event-stream",
+            # Tell proxies not to buffer the stream
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _live_search_counts(kind, hits):
+    if not hits:
+        return
+    storage = get_async_storage()
+    load = storage.get_posts if kind == "posts" else storage.get_communities
+    docs = {doc["id"]: doc for doc in await counters.overlay(kind, await load([hit["id"] for hit in hits]))}
+    for hit in hits:
+        # A document deleted since indexing keeps its indexed counts
+        doc = docs.get(hit["id"], hit)
+        for field in SEARCH_COUNT_FIELDS[kind]:
+            hit[field] = doc.get(field) or 0
+
+# Search communities and posts. Without `kind` the first page of both is
+# returned; pass kind plus the matching next cursor to page through one.
+@router.get("/search")
+async def search(query: str, kind: Optional[str] = None, limit: int = DEFAULT_LIMIT, after: Optional[str] = None):
+    try:
+        kinds = (kind,) if kind else SEARCH_KINDS
+        if any(k not in SEARCH_KINDS for k in kinds):
+            raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(SEARCH_KINDS)}")
+        limit = max(1, min(limit, MAX_LIMIT))
+        try:
+            cursor = decode_cursor(after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if cursor is not None:
+            # A cursor pages through one kind's results
+            if not kind:
+                raise HTTPException(status_code=400, detail="after requires kind")
+            if not is_search_cursor(cursor):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        await search_engine.ensure_loaded()
+        results = {"communities": [], "posts": [], "next_cursors": {}}
+        for k in kinds:
+            hits, last_key = search_engine.search(k, query, limit, cursor)
+            results[k] = hits
+            results["next_cursors"][k] = encode_cursor(last_key) if last_key else None
         
-        # Search communities
-        communities_ref = db.collection("communities").stream()
-        for doc in communities_ref:
-            community = doc.to_dict()
-            if (query.lower() in community.get("name", "").lower() or 
-                query.lower() in community.get("description", "").lower()):
-                results["communities"].append(community)
-        
-        # Search posts
-        posts_ref = db.collection("posts").stream()
-        for doc in posts_ref:
-            post = doc.to_dict()
-            if (query.lower() in post.get("title", "").lower() or 
-                query.lower() in post.get("content", "").lower()):
-                results["posts"].append(post)
-        
-        return results
+        # The index keeps the counts as of indexing; serve the current ones
+        await asyncio.gather(*(_live_search_counts(k, results[k]) for k in kinds))
+        return json_response(results)
+    except HTTPException as he:
+        raise he
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Re-read the datastore into this worker's search index (admins only). By
+# default only new or changed documents are re-tokenized; full=true rebuilds
+# from scratch.
+@router.post("/search/reindex")
+async def reindex_search(full: bool = False, user: dict = Depends(admin_user)):
+    try:
+        started = time.perf_counter()
+        indexed = await search_engine.reindex(full=full)
+        return {"indexed": indexed, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Operational metrics
+@router.get("/metrics")
+async def metrics():
+    return {
+        "startup": timings,
+        "vote_buffer": vote_buffer.stats(),
+        "counters": counters.stats(),
+        "ranking": ranking.stats(),
+        "search": search_engine.stats(),
+        "typeahead": typeahead.stats(),
+        "availability": availability.stats(),
+        "sessions": sessions.stats(),
+        "live": live.stats(),
+        "response_cache": response_cache.stats(),
+    }
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if not LAZY_INIT:
+        get_async_storage()
+        await availability.ensure_loaded()
+    timings["startup_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info("Startup finished in %.2f ms (import %.2f ms)", timings["startup_ms"], timings["import_ms"])
+    vote_buffer.start()
+    counters.start()
+    ranking.start()
+    search_engine.start()
+    typeahead.start()
+    availability.start()
+    yield
+    await availability.stop()
+    await typeahead.stop()
+    await search_engine.stop()
+    await ranking.stop()
+    await vote_buffer.stop()
+    await counters.stop()
+    await shutdown_password_pool()
+    await close_storage()
+
+
+def create_app():
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    # gzip / brotli for large bodies, per Accept-Encoding
+    app.add_middleware(CompressionMiddleware)
+    return app
+
+
+app = create_app()
+timings["import_ms"] = round((time.perf_counter() - IMPORT_STARTED) * 1000, 2)
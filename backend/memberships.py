@@ -0,0 +1,32 @@
+from datetime import datetime
+
+
+def migrate_member_arrays(storage):
+    """Move communities' legacy `members` arrays to membership documents and
+    users' joined_communities. Safe to re-run. Returns the number of
+    memberships created."""
+    created = 0
+    now = datetime.utcnow().isoformat()
+    for community in storage.list_communities():
+        members = community.get("members")
+        if not members:
+            continue
+        for user_email in members:
+            user = storage.get_user_by_email(user_email)
+            if storage.add_member(community["id"], user_email, user and user["id"], community.get("created_at") or now):
+                created += 1
+        # The documents are now the source of truth; drop the array so the
+        # community doc stops growing with its membership
+        storage.update_community(community["id"], {"members": []})
+    return created
+
+
+if __name__ == "__main__":
+    # python -m backend.memberships: migrate members arrays, then recount
+    import asyncio
+
+    from backend.counters import ShardedCounters
+    from backend.database import get_async_storage, get_storage
+
+    print(f"Created {migrate_member_arrays(get_storage())} memberships")
+    print(f"Reconciled {asyncio.run(ShardedCounters(get_async_storage).reconcile())} counters")
@@ -0,0 +1,38 @@
+import base64
+import json
+
+DEFAULT_LIMIT = 25
+MAX_LIMIT = 100
+
+
+def encode_cursor(values):
+    """Turn the sort key of the last item on a page into an opaque cursor."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def project(doc, fields):
+    """Keep only `fields` of a document; "preview" is a short excerpt of the
+    post content rather than a stored field."""
+    projected = {}
+    for field in fields:
+        if field == "preview":
+            content = doc.get("content") or ""
+            projected["preview"] = content[:300] + "..." if len(content) > 300 else content
+        else:
+            projected[field] = doc.get(field)
+    return projected
@@ -0,0 +1,29 @@
+def is_post_cursor(cursor, order_by):
+    # [order_by, value, id]: the ordering is part of the cursor, so a page
+    # token can't be replayed against the other sort key
+    if not (isinstance(cursor, list) and len(cursor) == 3 and cursor[0] == order_by and isinstance(cursor[2], str)):
+        return False
+    value = cursor[1]
+    if order_by == "score":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, str)
+
+
+def backfill_scores(storage):
+    """Give posts written before posts carried a score one, so ordering by
+    score (which skips documents without the field) lists them. Safe to
+    re-run. Returns the number of posts updated."""
+    updated = 0
+    for post in storage.list_posts():
+        if "score" in post:
+            continue
+        storage.update_post(post["id"], {"score": post.get("upvotes", 0) - post.get("downvotes", 0)})
+        updated += 1
+    return updated
+
+
+if __name__ == "__main__":
+    # python -m backend.posts: backfill post scores; run before serving traffic
+    from backend.database import get_storage
+
+    print(f"Updated {backfill_scores(get_storage())} posts")
@@ -0,0 +1,259 @@
+import asyncio
+import heapq
+import logging
+import math
+import os
+import time
+from bisect import bisect_right, insort
+from datetime import datetime, timezone
+
+from backend.pagination import project
+
+logger = logging.getLogger(__name__)
+
+# Seconds between full rebuilds from the datastore, which pick up votes and
+# posts handled by other workers
+REFRESH_INTERVAL = float(os.environ.get("RANKING_REFRESH_INTERVAL", "300"))
+
+SORTS = ("hot", "new", "top", "rising")
+WINDOWS = {
+    "day": 24 * 3600,
+    "week": 7 * 24 * 3600,
+    "month": 30 * 24 * 3600,
+    "all": None,
+}
+
+# Fields kept for each post so feeds are served without touching the datastore
+FEED_FIELDS = ["id", "title", "author", "community_id", "community_name", "created_at", "upvotes", "downvotes", "comment_count", "preview"]
+
+# Scores are time-decayed by adding age in seconds / DECAY, so an older post
+# needs 10x the votes to rank alongside one DECAY seconds newer. Because the
+# decay only depends on creation time, scores never need recomputing as
+# time passes; only votes and comments move them.
+EPOCH = 1704067200  # 2024-01-01 UTC
+HOT_DECAY = 45000
+# Rising is hot with a 3 hour decay rather than true vote velocity: it
+# favours newer posts, but needs no per-vote timestamps, which only the
+# worker that took a vote would see.
+RISING_DECAY = 10800
+COMMENT_WEIGHT = 0.5
+
+
+def created_ts(created_at):
+    try:
+        return datetime.fromisoformat(created_at).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return float(EPOCH)
+
+
+def _decayed(score, timestamp, decay):
+    order = math.log10(max(abs(score), 1))
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    return round(sign * order + (timestamp - EPOCH) / decay, 7)
+
+
+def hot_score(upvotes, downvotes, comment_count, timestamp):
+    return _decayed(upvotes - downvotes + COMMENT_WEIGHT * comment_count, timestamp, HOT_DECAY)
+
+
+def rising_score(upvotes, downvotes, comment_count, timestamp):
+    return _decayed(upvotes - downvotes + COMMENT_WEIGHT * comment_count, timestamp, RISING_DECAY)
+
+
+def is_feed_cursor(cursor):
+    # [-rank, post id], as SortedIndex keys are
+    return (
+        isinstance(cursor, list)
+        and len(cursor) == 2
+        and isinstance(cursor[0], (int, float))
+        and not isinstance(cursor[0], bool)
+        and isinstance(cursor[1], str)
+    )
+
+
+def ranks(post):
+    upvotes = post.get("upvotes", 0)
+    downvotes = post.get("downvotes", 0)
+    comments = post.get("comment_count", 0)
+    timestamp = post["_ts"]
+    return {
+        "hot": hot_score(upvotes, downvotes, comments, timestamp),
+        "new": timestamp,
+        "top": upvotes - downvotes,
+        "rising": rising_score(upvotes, downvotes, comments, timestamp),
+    }
+
+
+class SortedIndex:
+    """Posts ordered by descending rank, as a sorted list of (-rank, id)."""
+
+    def __init__(self):
+        self.keys = []
+        self.by_id = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def upsert(self, post_id, rank):
+        key = (-rank, post_id)
+        old = self.by_id.get(post_id)
+        if old == key:
+            return
+        if old is not None:
+            del self.keys[bisect_right(self.keys, old) - 1]
+        insort(self.keys, key)
+        self.by_id[post_id] = key
+
+    def remove(self, post_id):
+        old = self.by_id.pop(post_id, None)
+        if old is not None:
+            del self.keys[bisect_right(self.keys, old) - 1]
+
+    def page(self, limit, after=None):
+        start = bisect_right(self.keys, tuple(after)) if after else 0
+        return self.keys[start:start + limit]
+
+
+class RankingEngine:
+    """Precomputed Hot / New / Top / Rising feeds per time window.
+
+    Every (sort, window) pair has its own SortedIndex. Votes, comments and
+    new posts update the affected post's ranks in place; posts fall out of
+    a window's indexes as they age past it.
+    """
+
+    def __init__(self, get_storage, refresh_interval=REFRESH_INTERVAL):
+        self.get_storage = get_storage
+        self.refresh_interval = refresh_interval
+        self.posts = {}
+        self.indexes = {(sort, window): SortedIndex() for sort in SORTS for window in WINDOWS}
+        # Per window, a heap of (created timestamp, post id) for expiry
+        self.expiry = {window: [] for window, seconds in WINDOWS.items() if seconds}
+        self.loaded_at = None
+        # Updates made while a reload awaits the datastore, replayed onto the
+        # reloaded feeds; None when no reload is running
+        self._pending = None
+        self._load_lock = asyncio.Lock()
+        self._task = None
+
+    async def ensure_loaded(self):
+        """Build the feeds on first use; rebuilds after that happen in the
+        background task, off the request path."""
+        if self.loaded_at is not None:
+            return
+        async with self._load_lock:
+            if self.loaded_at is None:
+                await self._reload()
+
+    async def refresh(self):
+        async with self._load_lock:
+            await self._reload()
+
+    async def _reload(self):
+        # Comment counts as of the last fold; on_comment adds this worker's since
+        self._pending = []
+        try:
+            posts = await self.get_storage().list_posts()
+        finally:
+            pending, self._pending = self._pending, None
+        self.load(posts)
+        for update, args in pending:
+            update(*args)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            # Feeds nobody has asked for yet stay unloaded
+            if self.loaded_at is None:
+                continue
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Ranking refresh failed; serving the previous feeds")
+
+    def start(self):
+        if self.refresh_interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def load(self, posts):
+        self.posts = {}
+        self.indexes = {(sort, window): SortedIndex() for sort in SORTS for window in WINDOWS}
+        self.expiry = {window: [] for window, seconds in WINDOWS.items() if seconds}
+        for post in posts:
+            self.add_post(post)
+        self.loaded_at = time.monotonic()
+
+    def add_post(self, post):
+        if self._pending is not None:
+            self._pending.append((self.add_post, (post,)))
+        entry = project(post, FEED_FIELDS)
+        entry["upvotes"] = entry["upvotes"] or 0
+        entry["downvotes"] = entry["downvotes"] or 0
+        entry["comment_count"] = entry["comment_count"] or 0
+        entry["_ts"] = created_ts(entry["created_at"])
+        self.posts[entry["id"]] = entry
+        now = time.time()
+        for window, seconds in WINDOWS.items():
+            if seconds and entry["_ts"] < now - seconds:
+                continue
+            if seconds:
+                heapq.heappush(self.expiry[window], (entry["_ts"], entry["id"]))
+            self._reindex(entry, window)
+
+    def _reindex(self, entry, window):
+        for sort, rank in ranks(entry).items():
+            self.indexes[(sort, window)].upsert(entry["id"], rank)
+
+    def _update(self, post_id, **deltas):
+        entry = self.posts.get(post_id)
+        if entry is None:
+            return
+        for field, amount in deltas.items():
+            entry[field] += amount
+        for window in WINDOWS:
+            if post_id in self.indexes[("new", window)].by_id:
+                self._reindex(entry, window)
+
+    def on_vote(self, post_id, upvote_delta, downvote_delta):
+        if self._pending is not None:
+            self._pending.append((self.on_vote, (post_id, upvote_delta, downvote_delta)))
+        self._update(post_id, upvotes=upvote_delta, downvotes=downvote_delta)
+
+    def on_comment(self, post_id):
+        if self._pending is not None:
+            self._pending.append((self.on_comment, (post_id,)))
+        self._update(post_id, comment_count=1)
+
+    def _expire(self):
+        now = time.time()
+        for window, heap in self.expiry.items():
+            cutoff = now - WINDOWS[window]
+            while heap and heap[0][0] < cutoff:
+                _, post_id = heapq.heappop(heap)
+                for sort in SORTS:
+                    self.indexes[(sort, window)].remove(post_id)
+
+    def page(self, sort, window, limit, after=None):
+        """Return (posts, cursor of the last post or None if no more)."""
+        self._expire()
+        keys = self.indexes[(sort, window)].page(limit + 1, after)
+        more = len(keys) > limit
+        keys = keys[:limit]
+        posts = [{k: v for k, v in self.posts[post_id].items() if k != "_ts"} for _, post_id in keys]
+        return posts, (list(keys[-1]) if more else None)
+
+    def stats(self):
+        return {
+            "posts": len(self.posts),
+            "indexed": {f"{sort}:{window}": len(index) for (sort, window), index in self.indexes.items()},
+            "loaded_seconds_ago": round(time.monotonic() - self.loaded_at, 1) if self.loaded_at is not None else None,
+        }
@@ -0,0 +1,27 @@
+from backend.storage import ConflictError
+
+
+def reserve_existing_users(storage):
+    """Create the email / username reservations of users registered before
+    reservations existed. Safe to re-run. Returns (users reserved, list of
+    conflicts), where a conflict is a user sharing a normalized email or
+    username with one reserved earlier; those need resolving by hand."""
+    reserved, conflicts = 0, []
+    for user in storage.list_users():
+        try:
+            # Re-writing a user is a no-op apart from creating its reservations
+            storage.create_user(user)
+            reserved += 1
+        except ConflictError as e:
+            conflicts.append((user["id"], e.field, e.value))
+    return reserved, conflicts
+
+
+if __name__ == "__main__":
+    # python -m backend.reservations: reserve existing users' emails and usernames
+    from backend.database import get_storage
+
+    reserved, conflicts = reserve_existing_users(get_storage())
+    print(f"Reserved {reserved} users")
+    for user_id, field, value in conflicts:
+        print(f"Conflict: user {user_id} {field} {value!r}")
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+
+# Seconds a cached response is served for (0 disables the cache). Write
+# handlers invalidate what they change right away; the TTL bounds how long
+# writes made through other workers can go unseen.
+TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "30"))
+MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+# Cap on the summed JSON size of cached responses
+MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+def _size(value):
+    return len(json.dumps(value, default=str, separators=(",", ":")))
+
+
+class ResponseCache:
+    """In-process LRU + TTL cache of read endpoint responses.
+
+    Entries are keyed by endpoint and parameters and carry tags naming what
+    they were built from, e.g. "post:<id>" for every response containing
+    that post. Write handlers invalidate tags, which drops exactly the
+    responses that could have changed.
+
+    Every invalidation also bumps a change counter for the tag and for its
+    kind ("post" for "post:<id>"). ETags are derived from those counters,
+    so a conditional GET is answered without loading anything.
+    """
+
+    def __init__(self, ttl=TTL, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, expires, tags, size)
+        self.by_tag = {}  # tag -> set of keys
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.not_modified = 0
+        # tag or tag kind -> number of invalidations
+        self.versions = {}
+        # Counters restart with the process, so ETags name it too
+        self.epoch = uuid.uuid4().hex
+        # Bumped by every invalidation, so a response loaded while one
+        # happened isn't cached
+        self.generation = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _drop(self, key):
+        _, _, tags, size = self.entries.pop(key)
+        self.bytes -= size
+        for tag in tags:
+            keys = self.by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_tag[tag]
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, tags):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (value, time.monotonic() + self.ttl, tuple(tags), size)
+        self.bytes += size
+        for tag in tags:
+            self.by_tag.setdefault(tag, set()).add(key)
+        # Evict least recently used entries until both caps are met
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.evictions += 1
+
+    async def get_or_load(self, key, load, tags):
+        """Return the cached response for `key`, or await `load()` and cache
+        its result. `tags` is a list of tags or a function of the result."""
+        if not self.enabled:
+            return await load()
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        generation = self.generation
+        value = await load()
+        if generation == self.generation:
+            self.put(key, value, tags(value) if callable(tags) else tags)
+        return value
+
+    def invalidate(self, *tags):
+        self.generation += 1
+        for tag in tags:
+            for name in {tag, tag.partition(":")[0]}:
+                self.versions[name] = self.versions.get(name, 0) + 1
+            for key in list(self.by_tag.get(tag, ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def etag(self, tags, key):
+        """Weak ETag for the response `key` built from `tags`, or None when
+        the cache is disabled. It changes whenever one of the tags is
+        invalidated, and at least every TTL so writes made through other
+        workers show up as they do for cached responses."""
+        if not self.enabled:
+            return None
+        state = [self.epoch, int(time.time() // self.ttl), key]
+        state += [f"{tag}={self.versions.get(tag, 0)}" for tag in tags]
+        return f'W/"{hashlib.blake2b(json.dumps(state).encode(), digest_size=12).hexdigest()}"'
+
+    def matches(self, etag, if_none_match):
+        """Whether an If-None-Match header names `etag` (weak comparison)."""
+        if etag is None or not if_none_match:
+            return False
+        candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+        if "*" in candidates or etag.removeprefix("W/") in candidates:
+            self.not_modified += 1
+            return True
+        return False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "not_modified": self.not_modified,
+        }
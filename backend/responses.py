@@ -0,0 +1,200 @@
+import asyncio
+import gzip
+import json
+import os
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Set CAMPUS_FAST_JSON=0 to render responses with the stdlib encoder
+FAST_JSON = os.environ.get("CAMPUS_FAST_JSON", "1") == "1" and orjson is not None
+# Bodies smaller than this are sent uncompressed; the headers would eat the saving
+COMPRESS_MIN_SIZE = int(os.environ.get("RESPONSE_COMPRESS_MIN_SIZE", "1024"))
+# Levels favouring speed, since every response is compressed on the fly
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+# Bodies above this are compressed on a worker thread (zlib and brotli release the GIL)
+OFFLOAD_SIZE = 256 * 1024
+
+
+def _default(value):
+    # Types orjson doesn't know (pydantic models, Firestore values) go through
+    # FastAPI's encoder one at a time
+    return jsonable_encoder(value)
+
+
+def dumps(content):
+    if FAST_JSON:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when it is installed.
+
+    Handlers that return one of these directly skip FastAPI's
+    jsonable_encoder pass over the whole payload, which dominates the cost
+    of returning large lists of documents.
+    """
+
+    def render(self, content):
+        return dumps(content)
+
+
+def json_response(content, headers=None, status_code=200):
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compresses response bodies with brotli or gzip, whichever the client's
+    Accept-Encoding allows (brotli preferred, when installed).
+
+    Only responses sent as a single body at least `min_size` bytes long are
+    compressed; streamed responses such as event streams pass through
+    untouched.
+    """
+
+    def __init__(self, app, min_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        accepted = _accepted_encodings(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if brotli is not None and "br" in accepted:
+            encoding = "br"
+        elif "gzip" in accepted:
+            encoding = "gzip"
+        else:
+            encoding = None
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Held until the body shows whether it can be compressed
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            response_start, start = start, None
+            body = message.get("body", b"")
+            response_headers = dict(response_start["headers"])
+            if (
+                message.get("more_body")
+                or len(body) < self.min_size
+                or b"content-encoding" in response_headers
+            ):
+                await send(response_start)
+                await send(message)
+                return
+            raw_headers = [(name, value) for name, value in response_start["headers"] if name != b"content-length"]
+            raw_headers.append((b"vary", b"Accept-Encoding"))
+            if encoding is not None:
+                if len(body) > OFFLOAD_SIZE:
+                    body = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    body = compress(body, encoding)
+                raw_headers.append((b"content-encoding", encoding.encode()))
+            raw_headers.append((b"content-length", str(len(body)).encode()))
+            await send(dict(response_start, headers=raw_headers))
+            await send(dict(message, body=body))
+
+        await self.app(scope, receive, send_compressed)
+
+
+if __name__ == "__main__":
+    # python -m backend.responses [posts]: compare serialization time and
+    # bytes on the wire for a list of full post documents
+    import sys
+    import time
+    import uuid
+    from datetime import datetime, timedelta
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    started_at = datetime(2025, 1, 1)
+    posts = [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"Post number {i} about campus events",
+            "content": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 8,
+            "author": f"user{i % 300}",
+            "community_id": str(uuid.UUID(int=i % 40)),
+            "community_name": f"community-{i % 40}",
+            "post_type": "text",
+            "created_at": (started_at + timedelta(minutes=i)).isoformat(),
+            "upvotes": i * 7 % 500,
+            "downvotes": i * 3 % 90,
+            "score": i * 4 % 410,
+            "comment_count": i % 60,
+            "tags": ["events", "clubs", f"tag{i % 25}"],
+        }
+        for i in range(count)
+    ]
+
+    def timed(func, rounds=5):
+        best = float("inf")
+        for _ in range(rounds):
+            started = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - started)
+        return result, best * 1000
+
+    # What FastAPI does with a returned dict: encode the tree, then json.dumps
+    baseline, baseline_ms = timed(lambda: json.dumps(
+        jsonable_encoder(posts), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode())
+    print(f"{count} posts")
+    print(f"  jsonable_encoder + json: {baseline_ms:8.1f} ms  {len(baseline):>10,} bytes")
+    if orjson is not None:
+        fast, fast_ms = timed(lambda: orjson.dumps(posts, default=_default, option=orjson.OPT_NON_STR_KEYS))
+        print(f"  orjson:                  {fast_ms:8.1f} ms  {len(fast):>10,} bytes  ({baseline_ms / fast_ms:.1f}x faster)")
+    else:
+        fast = baseline
+        print("  orjson:                  not installed")
+    for encoding in ("gzip", "br"):
+        if encoding == "br" and brotli is None:
+            print("  br:                      not installed")
+            continue
+        compressed, compress_ms = timed(lambda: compress(fast, encoding))
+        print(
+            f"  {encoding + ':':<24} {compress_ms:8.1f} ms  {len(compressed):>10,} bytes"
+            f"  ({len(compressed) / len(fast):.1%} of uncompressed)"
+        )
@@ -1,31 +1,36 @@
+import asyncio
+
 from fastapi import APIRouter, HTTPException
-from backend.security import hash_password, verify_password
+from backend.security import hash_password_async, verify_password_async
 from backend.database import users_collection  # Firestore collection for users
 from backend.models import UserCreate, UserLogin  # Pydantic models
 
 auth_router = APIRouter()
 
+# Firestore calls here are blocking, so they run on a worker thread, and
+# bcrypt runs in the password process pool; the event loop never waits on either
+
 @auth_router.post("/register")
 async def register(user: UserCreate):
-    existing_user = users_collection.document(user.email).get()
+    existing_user = await asyncio.to_thread(lambda: users_collection.document(user.email).get())
     if existing_user.exists:
         raise HTTPException(status_code=400, detail="User already exists")
 
-    hashed_password = hash_password(user.password)
-    users_collection.document(user.email).set({
+    hashed_password = await hash_password_async(user.password)
+    await asyncio.to_thread(lambda: users_collection.document(user.email).set({
         "email": user.email,
         "password": hashed_password
-    })
+    }))
     return {"message": "User registered successfully"}
 
 @auth_router.post("/login")
 async def login(user: UserLogin):
-    stored_user = users_collection.document(user.email).get()
+    stored_user = await asyncio.to_thread(lambda: users_collection.document(user.email).get())
     if not stored_user.exists:
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     user_data = stored_user.to_dict()
-    if not verify_password(user.password, user_data["password"]):
+    if not await verify_password_async(user.password, user_data["password"]):
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
-    return {"message": "Login successful"}
\ No newline at end of file
+    return {"message": "Login successful"}
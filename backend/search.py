@@ -0,0 +1,265 @@
+import asyncio
+import heapq
+import logging
+import math
+import os
+import re
+import time
+from bisect import bisect_left, insort
+
+from backend.pagination import project
+
+logger = logging.getLogger(__name__)
+
+# Seconds between incremental refreshes from the datastore, which pick up
+# documents created, changed or deleted by other workers
+REFRESH_INTERVAL = float(os.environ.get("SEARCH_REFRESH_INTERVAL", "300"))
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Searchable fields and their weights, and the fields returned in results
+INDEXED_FIELDS = {
+    "communities": {"name": 3, "description": 1, "topics": 2},
+    "posts": {"title": 3, "content": 1, "tags": 2},
+}
+RESULT_FIELDS = {
+    "communities": ["id", "name", "description", "topics", "visibility", "created_at"],
+    "posts": ["id", "title", "author", "community_id", "community_name", "created_at", "upvotes", "tags", "preview"],
+}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def is_search_cursor(cursor):
+    # [-score, doc id], as search() orders results
+    return (
+        isinstance(cursor, list)
+        and len(cursor) == 2
+        and isinstance(cursor[0], (int, float))
+        and not isinstance(cursor[0], bool)
+        and isinstance(cursor[1], str)
+    )
+
+
+def _field_text(value):
+    if isinstance(value, list):
+        return " ".join(str(item) for item in value if item)
+    return value if isinstance(value, str) else ""
+
+
+class InvertedIndex:
+    """BM25-ranked inverted index over one kind of document."""
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.postings = {}  # term -> {doc_id: weighted term frequency}
+        self.vocabulary = []  # sorted terms, for prefix expansion
+        self.doc_terms = {}  # doc_id -> {term: tf}, so a doc can be removed
+        self.doc_lengths = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, doc_id, doc):
+        self.remove(doc_id)
+        terms = {}
+        for field, weight in self.fields.items():
+            for token in tokenize(_field_text(doc.get(field))):
+                terms[token] = terms.get(token, 0) + weight
+        for term, tf in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                insort(self.vocabulary, term)
+            postings[doc_id] = tf
+        length = sum(terms.values())
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+                del self.vocabulary[bisect_left(self.vocabulary, term)]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def expand_prefix(self, prefix, limit=50):
+        start = bisect_left(self.vocabulary, prefix)
+        matches = []
+        for term in self.vocabulary[start:start + limit]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def score(self, query_terms):
+        """Return {doc_id: BM25 score} for documents matching any term.
+
+        Work is proportional to the length of the posting lists touched,
+        not the number of indexed documents.
+        """
+        count = len(self.doc_terms)
+        if not count:
+            return {}
+        average_length = self.total_length / count or 1
+        scores = {}
+        for term, boost in query_terms.items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = K1 * (1 - B + B * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + boost * idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+
+class SearchEngine:
+    """Full-text search over communities and posts.
+
+    Documents are indexed as they are created and refreshed incrementally
+    from the datastore by a background task: a refresh only re-tokenizes
+    documents that are new or whose updated_at moved past what was indexed,
+    and drops those no longer in the datastore.
+    """
+
+    def __init__(self, get_storage, refresh_interval=REFRESH_INTERVAL):
+        self.get_storage = get_storage
+        self.refresh_interval = refresh_interval
+        self.indexes = {kind: InvertedIndex(fields) for kind, fields in INDEXED_FIELDS.items()}
+        self.documents = {kind: {} for kind in INDEXED_FIELDS}
+        self.versions = {kind: {} for kind in INDEXED_FIELDS}
+        self.refreshed_at = None
+        # (kind, id) -> document added while a reindex awaits the datastore;
+        # newer than the snapshot, so never evicted or overwritten by it
+        self._pending = None
+        self._refresh_lock = asyncio.Lock()
+        self._task = None
+
+    def add(self, kind, doc):
+        if self._pending is not None:
+            self._pending[(kind, doc["id"])] = doc
+        self.indexes[kind].add(doc["id"], doc)
+        self.documents[kind][doc["id"]] = project(doc, RESULT_FIELDS[kind])
+        self.versions[kind][doc["id"]] = doc.get("updated_at") or doc.get("created_at")
+
+    def _remove(self, kind, doc_id):
+        self.indexes[kind].remove(doc_id)
+        self.documents[kind].pop(doc_id, None)
+        self.versions[kind].pop(doc_id, None)
+
+    async def ensure_loaded(self):
+        """Index on first use; refreshes after that happen in the background
+        task, off the request path."""
+        if self.refreshed_at is not None:
+            return
+        async with self._refresh_lock:
+            if self.refreshed_at is None:
+                await self._reindex()
+
+    async def reindex(self, full=False):
+        """Refresh from the datastore. Returns how many documents were
+        (re)indexed."""
+        async with self._refresh_lock:
+            return await self._reindex(full)
+
+    async def _reindex(self, full=False):
+        storage = self.get_storage()
+        self._pending = {}
+        try:
+            communities, posts = await asyncio.gather(storage.list_communities(), storage.list_posts())
+        finally:
+            pending, self._pending = self._pending, None
+        if full:
+            self.indexes = {kind: InvertedIndex(fields) for kind, fields in INDEXED_FIELDS.items()}
+            self.documents = {kind: {} for kind in INDEXED_FIELDS}
+            self.versions = {kind: {} for kind in INDEXED_FIELDS}
+        indexed = 0
+        for kind, docs in (("communities", communities), ("posts", posts)):
+            versions = self.versions[kind]
+            seen = set()
+            for doc in docs:
+                seen.add(doc["id"])
+                if (kind, doc["id"]) in pending:
+                    continue
+                version = doc.get("updated_at") or doc.get("created_at")
+                if doc["id"] in versions and versions[doc["id"]] == version:
+                    continue
+                self.add(kind, doc)
+                indexed += 1
+            # Deleted from the datastore since they were indexed
+            for doc_id in [doc_id for doc_id in versions if doc_id not in seen and (kind, doc_id) not in pending]:
+                self._remove(kind, doc_id)
+        # Added while the snapshot was read; only lost if the indexes were rebuilt
+        if full:
+            for (kind, _), doc in pending.items():
+                self.add(kind, doc)
+        self.refreshed_at = time.monotonic()
+        return indexed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            # Indexes nobody has searched yet stay unloaded
+            if self.refreshed_at is None:
+                continue
+            try:
+                await self.reindex()
+            except Exception:
+                logger.exception("Search refresh failed; serving the previous index")
+
+    def start(self):
+        if self.refresh_interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _query_terms(self, index, query):
+        tokens = tokenize(query)
+        terms = {token: 1.0 for token in tokens}
+        # The last word may still be being typed, so also match it as a prefix
+        if tokens and not query[-1:].isspace():
+            for term in index.expand_prefix(tokens[-1]):
+                terms.setdefault(term, 0.5)
+        return terms
+
+    def search(self, kind, query, limit, after=None):
+        """Return (results, cursor of the last result or None if no more)."""
+        index = self.indexes[kind]
+        scores = index.score(self._query_terms(index, query))
+        keys = ((-round(score, 9), doc_id) for doc_id, score in scores.items())
+        if after:
+            bound = tuple(after)
+            keys = (key for key in keys if key > bound)
+        page = heapq.nsmallest(limit + 1, keys)
+        more = len(page) > limit
+        page = page[:limit]
+        documents = self.documents[kind]
+        results = [dict(documents[doc_id], score=-key) for key, doc_id in page]
+        return results, (list(page[-1]) if more else None)
+
+    def stats(self):
+        return {
+            kind: {"documents": len(index), "terms": len(index.postings)}
+            for kind, index in self.indexes.items()
+        }
@@ -1,9 +1,57 @@
-from passlib.context import CryptContext
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# bcrypt cost factor: each +1 doubles the time per hash (12 is ~250 ms)
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# Processes hashing passwords, and how many hashes may be queued for them
+# before callers wait on the event loop
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_PENDING_HASHES = int(os.environ.get("PASSWORD_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+_pool = None
+_pending = None
+
+
+@lru_cache(maxsize=None)
+def _pwd_context():
+    # Imported on first use (once per pool process), so the API can import
+    # this module to shut the pool down without passlib installed
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
\ No newline at end of file
+    return _pwd_context().verify(plain_password, hashed_password)
+
+
+async def _run_in_pool(func, *args):
+    # bcrypt holds the CPU for the whole hash, so it runs in worker processes
+    # instead of blocking this event loop (or contending for the GIL)
+    global _pool, _pending
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        _pending = asyncio.Semaphore(MAX_PENDING_HASHES)
+    async with _pending:
+        return await asyncio.get_running_loop().run_in_executor(_pool, func, *args)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_pool(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_pool(verify_password, plain_password, hashed_password)
+
+
+async def shutdown_pool():
+    """Stop the hashing processes, dropping queued hashes; called from the
+    app's lifespan. A later hash starts a new pool."""
+    global _pool, _pending
+    pool, _pool, _pending = _pool, None, None
+    if pool is not None:
+        # Waits for in-flight hashes, so keep it off the event loop
+        await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
@@ -0,0 +1,124 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Key tokens are signed with. Every worker must share it for tokens to work
+# across workers and restarts; without it each process makes up its own.
+SECRET = os.environ.get("SESSION_SECRET")
+# Seconds a token stays valid
+TOKEN_TTL = int(os.environ.get("SESSION_TTL", str(12 * 3600)))
+# Comma-separated emails of the users allowed to call operational endpoints
+ADMIN_EMAILS = frozenset(
+    email.strip().lower() for email in os.environ.get("ADMIN_EMAILS", "").split(",") if email.strip()
+)
+
+_HEADER = {"alg": "HS256", "typ": "JWT"}
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionTokens:
+    """Issues and verifies HS256 JWTs carrying the user's id, username and
+    email, so authenticated requests are checked with one HMAC and no
+    datastore read.
+
+    Tokens can't be recalled once issued, so logout records the token's id in
+    an in-memory revocation list until the token would have expired anyway.
+    """
+
+    def __init__(self, secret=SECRET, ttl=TOKEN_TTL):
+        if not secret:
+            logger.warning("SESSION_SECRET is not set; sessions won't survive a restart or work across workers")
+            secret = secrets.token_hex(32)
+        self.key = secret.encode()
+        self.ttl = ttl
+        self.revoked = {}  # token id -> expiry
+        self._lock = threading.Lock()
+
+    def _sign(self, signing_input):
+        return _b64encode(hmac.new(self.key, signing_input.encode(), hashlib.sha256).digest())
+
+    def issue(self, user):
+        now = int(time.time())
+        claims = {
+            "sub": user["id"],
+            "username": user.get("username"),
+            "email": user.get("email"),
+            "iat": now,
+            "exp": now + self.ttl,
+            "jti": uuid.uuid4().hex,
+        }
+        signing_input = f"{_b64encode(json.dumps(_HEADER).encode())}.{_b64encode(json.dumps(claims).encode())}"
+        return f"{signing_input}.{self._sign(signing_input)}", claims
+
+    def verify(self, token):
+        """Return the token's claims. Raises ValueError if the token is
+        malformed, forged, expired or revoked."""
+        try:
+            header, payload, signature = token.split(".")
+        except (AttributeError, ValueError):
+            raise ValueError("Malformed token")
+        if not hmac.compare_digest(signature, self._sign(f"{header}.{payload}")):
+            raise ValueError("Invalid token signature")
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            raise ValueError("Malformed token")
+        if claims.get("exp", 0) <= time.time():
+            raise ValueError("Token expired")
+        if claims.get("jti") in self.revoked:
+            raise ValueError("Token revoked")
+        return claims
+
+    def revoke(self, claims):
+        now = time.time()
+        with self._lock:
+            # Expired tokens fail verification anyway, so drop their entries
+            for jti in [jti for jti, expires in self.revoked.items() if expires <= now]:
+                del self.revoked[jti]
+            self.revoked[claims["jti"]] = claims["exp"]
+
+    def stats(self):
+        return {"ttl_seconds": self.ttl, "revoked": len(self.revoked)}
+
+
+sessions = SessionTokens()
+
+
+async def current_user(authorization: Optional[str] = Header(None)):
+    """FastAPI dependency: the claims of the request's bearer token.
+
+    Verification is one HMAC and never blocks, so it runs on the event loop
+    instead of taking a threadpool hop on every authenticated request."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Not signed in", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return sessions.verify(token.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+async def admin_user(user: dict = Depends(current_user)):
+    """FastAPI dependency: current_user, restricted to ADMIN_EMAILS."""
+    if (user.get("email") or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admins only")
+    return user
@@ -0,0 +1,46 @@
+import os
+
+from backend.storage.async_base import AsyncStorageAdapter, AsyncStorageEngine, SyncStorageAdapter
+from backend.storage.base import ConflictError, StorageEngine
+
+# Which engine the API runs on: "firestore" (default), "sqlite" or "memory"
+STORAGE_ENGINE = os.environ.get("CAMPUS_STORAGE", "firestore")
+SQLITE_PATH = os.environ.get("CAMPUS_SQLITE_PATH", "campus_connect.db")
+
+
+def create_storage(engine=None, client=None):
+    """Build the sync engine. For Firestore `client` is a callable returning
+    a new AsyncClient, as the sync engine runs the async one."""
+    engine = engine or STORAGE_ENGINE
+    if engine == "firestore":
+        from backend.storage.firestore_engine import FirestoreStorage
+        return FirestoreStorage(client)
+    if engine == "sqlite":
+        from backend.storage.sqlite_engine import SQLiteStorage
+        return SQLiteStorage(SQLITE_PATH)
+    if engine == "memory":
+        from backend.storage.memory_engine import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown storage engine: {engine}")
+
+
+def create_async_storage(engine=None, client=None, sync_storage=None):
+    """Build the async engine. `client` is a Firestore AsyncClient; other
+    engines wrap `sync_storage` (or a new sync engine) in an adapter."""
+    engine = engine or STORAGE_ENGINE
+    if engine == "firestore":
+        from backend.storage.firestore_async_engine import AsyncFirestoreStorage
+        return AsyncFirestoreStorage(client)
+    return AsyncStorageAdapter(sync_storage or create_storage(engine))
+
+
+__all__ = [
+    "AsyncStorageAdapter",
+    "AsyncStorageEngine",
+    "ConflictError",
+    "StorageEngine",
+    "SyncStorageAdapter",
+    "create_async_storage",
+    "create_storage",
+    "STORAGE_ENGINE",
+]
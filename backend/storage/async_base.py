@@ -0,0 +1,93 @@
+import asyncio
+import functools
+import threading
+
+
+class AsyncStorageEngine:
+    """Async counterpart of StorageEngine.
+
+    Exposes the same methods as coroutines. Engines with a native async
+    client (Firestore's AsyncClient) subclass it directly; synchronous
+    engines are wrapped in AsyncStorageAdapter, and SyncStorageAdapter goes
+    the other way for the command-line tooling.
+    """
+
+    name = "base"
+
+    async def close(self):
+        pass
+
+
+class AsyncStorageAdapter(AsyncStorageEngine):
+    """Runs a synchronous StorageEngine behind the async interface.
+
+    Blocking engines (SQLite) are called on a worker thread so the event loop
+    keeps serving other requests; engines that never block (in-memory) are
+    called inline to skip the thread hop.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.name = engine.name
+
+    def __getattr__(self, attr):
+        method = getattr(self.engine, attr)
+        if not callable(method):
+            return method
+
+        if getattr(self.engine, "blocking", True):
+            @functools.wraps(method)
+            async def call(*args, **kwargs):
+                return await asyncio.to_thread(method, *args, **kwargs)
+        else:
+            @functools.wraps(method)
+            async def call(*args, **kwargs):
+                return method(*args, **kwargs)
+
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, attr, call)
+        return call
+
+    async def close(self):
+        self.engine.close()
+
+
+class SyncStorageAdapter:
+    """Runs an AsyncStorageEngine behind the synchronous interface.
+
+    The engine lives on a private event loop in a daemon thread and each
+    call blocks until its coroutine finishes there, so an engine written
+    once against an async client also serves the maintenance commands.
+    `create_engine` is called on that loop, letting the client bind to it.
+    """
+
+    blocking = True
+
+    def __init__(self, create_engine):
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="storage-loop", daemon=True).start()
+        self.engine = self._run(_create(create_engine))
+        self.name = self.engine.name
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def __getattr__(self, attr):
+        method = getattr(self.engine, attr)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        def call(*args, **kwargs):
+            return self._run(method(*args, **kwargs))
+
+        setattr(self, attr, call)
+        return call
+
+    def close(self):
+        self._run(self.engine.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+async def _create(create_engine):
+    return create_engine()
@@ -0,0 +1,340 @@
+import math
+import unicodedata
+from urllib.parse import quote
+
+# Orders a comment's replies can be listed in. "old" and "new" follow the
+# materialized path (siblings' paths sort by creation time); "top" and "best"
+# sort by the "score" / "best" field, highest first, with ties oldest first.
+COMMENT_SORTS = ("best", "top", "new", "old")
+COMMENT_SORT_FIELDS = {"top": "score", "best": "best"}
+
+# z for an 80% confidence interval
+WILSON_Z = 1.281551565545
+
+
+def vote_key(post_id, user_id):
+    # Votes are keyed by (post, user) so a user's vote is a point read
+    return f"{post_id}_{user_id}"
+
+
+class ConflictError(Exception):
+    """A write would take a unique value (e.g. an email) that belongs to
+    another document."""
+
+    def __init__(self, field, value):
+        super().__init__(f"{field} {value!r} is already taken")
+        self.field = field
+        self.value = value
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def normalize_username(username):
+    return unicodedata.normalize("NFKC", username or "").strip().casefold()
+
+
+# Which user field each reservation collection guards
+RESERVED_FIELDS = {"unique_emails": "email", "unique_usernames": "username"}
+
+
+def reservation_id(collection, value):
+    # The normalized value, quoted so it is a valid document id
+    if collection == "unique_emails":
+        return quote(normalize_email(value), safe="@")
+    return quote(normalize_username(value), safe="")
+
+
+def user_reservations(user):
+    """The reservation documents that make a user's email and username
+    unique: {collection: document id}, so a check is a point read."""
+    return {collection: reservation_id(collection, user.get(field)) for collection, field in RESERVED_FIELDS.items()}
+
+
+def membership_key(community_id, user_email):
+    # One document per (community, member), so joins never touch a list
+    return f"{community_id}_{user_email}"
+
+
+def resolve_vote(existing_type, vote_type):
+    """Work out what casting `vote_type` does to a post.
+
+    Voting the same way twice removes the vote, voting the other way switches
+    it. Returns (new_vote_type or None, upvote_delta, downvote_delta). The
+    deltas depend only on the vote documents, so counters can be maintained
+    with plain increments and summed across buffered writes.
+    """
+    new_type = None if existing_type == vote_type else vote_type
+    upvote_delta = (new_type == "upvote") - (existing_type == "upvote")
+    downvote_delta = (new_type == "downvote") - (existing_type == "downvote")
+    return new_type, upvote_delta, downvote_delta
+
+
+def resolve_votes(votes, posts, vote_types):
+    """Apply one user's (post_id, vote_type) pairs in order, as that many
+    resolve_vote calls would.
+
+    `posts` maps the ids of the posts that exist to their documents;
+    `vote_types` maps post ids to the user's current vote and is updated to
+    the final ones. Returns a result per pair shaped like apply_vote's (None
+    where the post doesn't exist) and the summed
+    {post_id: (upvote_delta, downvote_delta)} for every post in `posts`.
+    """
+    deltas = {post_id: (0, 0) for post_id in posts}
+    results = []
+    for post_id, vote_type in votes:
+        post = posts.get(post_id)
+        if post is None:
+            results.append(None)
+            continue
+        vote_types[post_id], upvote_delta, downvote_delta = resolve_vote(vote_types.get(post_id), vote_type)
+        total_upvotes, total_downvotes = deltas[post_id]
+        deltas[post_id] = total_upvotes + upvote_delta, total_downvotes + downvote_delta
+        results.append({
+            "vote_type": vote_types[post_id],
+            "upvotes": post.get("upvotes", 0) + deltas[post_id][0],
+            "downvotes": post.get("downvotes", 0) + deltas[post_id][1],
+            "upvote_delta": upvote_delta,
+            "downvote_delta": downvote_delta,
+        })
+    return results, deltas
+
+
+def wilson_lower_bound(upvotes, downvotes, z=WILSON_Z):
+    """Lower bound of the Wilson score interval for the share of upvotes.
+
+    Ranks a comment by how sure we can be that it is liked, so 10 up / 1 down
+    beats 40 up / 20 down, and a single upvote doesn't beat either.
+    """
+    total = upvotes + downvotes
+    if total <= 0:
+        return 0.0
+    share = upvotes / total
+    spread = z * math.sqrt(share * (1 - share) / total + z * z / (4 * total * total))
+    return round((share + z * z / (2 * total) - spread) / (1 + z * z / total), 9)
+
+
+def comment_ranks(upvotes, downvotes):
+    """The stored sort fields of a comment with these vote counts."""
+    return {"score": upvotes - downvotes, "best": wilson_lower_bound(upvotes, downvotes)}
+
+
+def comment_cursor(comment, sort):
+    """Where a page of replies listed in `sort` order ended."""
+    field = COMMENT_SORT_FIELDS.get(sort)
+    return [comment["path"]] if field is None else [comment.get(field) or 0, comment["path"]]
+
+
+class StorageEngine:
+    """Interface every datastore backend implements.
+
+    Documents are plain dicts shaped exactly like the Firestore documents the
+    API has always returned, so handlers never need to know which engine is
+    serving them. Lookups return None when nothing matches.
+    """
+
+    name = "base"
+    # Whether calls do I/O that would stall an event loop
+    blocking = True
+
+    # Users
+    def create_user(self, user):
+        """Write the user together with its user_reservations in one
+        transaction. Raises ConflictError if another user holds either."""
+        raise NotImplementedError
+
+    def list_users(self, fields=None):
+        """All users. `fields` is a hint that only those fields are needed;
+        engines may return more."""
+        raise NotImplementedError
+
+    def get_reservation(self, collection, value_id):
+        """Id of the user holding reservation `value_id` (a reservation_id)
+        in `collection`, or None."""
+        raise NotImplementedError
+
+    def get_user(self, user_id):
+        raise NotImplementedError
+
+    def get_users(self, user_ids):
+        """Batch lookup; returns the users that exist, in no particular order."""
+        raise NotImplementedError
+
+    def get_user_by_email(self, email):
+        raise NotImplementedError
+
+    def get_user_by_username(self, username):
+        raise NotImplementedError
+
+    # Communities
+    def create_community(self, community):
+        raise NotImplementedError
+
+    def get_community(self, community_id):
+        raise NotImplementedError
+
+    def get_community_by_name(self, name):
+        raise NotImplementedError
+
+    def update_community(self, community_id, fields):
+        raise NotImplementedError
+
+    def list_communities(self):
+        raise NotImplementedError
+
+    def list_communities_for_member(self, user_email):
+        raise NotImplementedError
+
+    def get_communities(self, community_ids):
+        """Batch lookup; returns the communities that exist, in no particular order."""
+        raise NotImplementedError
+
+    # Memberships
+    def add_member(self, community_id, user_email, user_id, now, read_post_count=0):
+        """Create the membership document and, if `user_id` is given, add the
+        community to that user's joined_communities, in one transaction.
+        `read_post_count` is the community's post_count the member has seen.
+        Returns False if the user was already a member."""
+        raise NotImplementedError
+
+    def remove_member(self, community_id, user_email, user_id):
+        """Undo add_member. Returns False if the user was not a member."""
+        raise NotImplementedError
+
+    def get_membership(self, community_id, user_email):
+        raise NotImplementedError
+
+    def update_membership(self, community_id, user_email, fields):
+        raise NotImplementedError
+
+    def list_members(self, community_id):
+        raise NotImplementedError
+
+    def list_memberships_for_member(self, user_email):
+        raise NotImplementedError
+
+    # Posts
+    def create_post(self, post):
+        raise NotImplementedError
+
+    def get_post(self, post_id):
+        raise NotImplementedError
+
+    def get_posts(self, post_ids):
+        """Batch lookup; returns the posts that exist, in no particular order."""
+        raise NotImplementedError
+
+    def update_post(self, post_id, fields):
+        raise NotImplementedError
+
+    def list_posts(self):
+        raise NotImplementedError
+
+    def list_posts_by_community(self, community_id):
+        raise NotImplementedError
+
+    def list_posts_page(self, order_by, limit, after=None, community_id=None, fields=None):
+        """Return up to `limit` posts in descending (order_by, id) order.
+
+        `order_by` is "created_at" or "score" (upvotes - downvotes, kept on
+        the document by the vote paths). `after` is the (value, id) of the
+        last post on the previous page. `fields` is a hint that only those
+        fields are needed; engines may return more.
+        """
+        raise NotImplementedError
+
+    # Comments
+    def create_comment(self, comment):
+        raise NotImplementedError
+
+    def get_comment(self, comment_id):
+        raise NotImplementedError
+
+    def list_comments_by_post(self, post_id):
+        raise NotImplementedError
+
+    def update_comment(self, comment_id, fields):
+        raise NotImplementedError
+
+    def increment_comment_fields(self, comment_id, deltas):
+        """Atomically add {field: amount} to a comment's numeric fields."""
+        raise NotImplementedError
+
+    def list_child_comments(self, post_id, parent_id, limit, after=None, sort="old"):
+        """Direct replies to `parent_id` (None for top-level comments) in one
+        of the COMMENT_SORTS orders. `after` is the comment_cursor of the last
+        comment on the previous page."""
+        raise NotImplementedError
+
+    def list_comment_descendants(self, post_id, path, max_depth, limit):
+        """Up to `limit` comments below the one at `path`, no deeper than
+        `max_depth`, in `path` order (a depth-first walk of the thread)."""
+        raise NotImplementedError
+
+    # Votes
+    def get_vote(self, post_id, user_id):
+        raise NotImplementedError
+
+    def list_votes(self):
+        """Every post vote, each with its document "id"."""
+        raise NotImplementedError
+
+    def replace_votes(self, vote, old_ids):
+        """Write `vote` under vote["id"] and delete the votes in `old_ids`
+        in one batch. Used to move votes to vote_key ids."""
+        raise NotImplementedError
+
+    def apply_vote(self, post_id, user_id, vote_type, now, update_counters=True):
+        """Atomically toggle a user's vote and, unless update_counters is
+        False, the post's counters in the same transaction.
+
+        Returns the post's new "upvotes"/"downvotes" together with the
+        "upvote_delta"/"downvote_delta" this vote contributes, or None if the
+        post does not exist. With update_counters=False the caller is
+        responsible for applying the deltas (see increment_post_counters).
+        """
+        raise NotImplementedError
+
+    def apply_votes(self, user_id, votes, now, update_counters=True):
+        """apply_vote for a list of (post_id, vote_type) pairs from one user,
+        applied in order in a single transaction. Returns a result per pair,
+        None where the post does not exist; the others also carry the
+        user's resulting "vote_type"."""
+        raise NotImplementedError
+
+    def apply_comment_vote(self, comment_id, user_id, vote_type, now):
+        """Like apply_vote, for a comment: toggles the vote and updates the
+        comment's upvotes, downvotes, score and best fields in one
+        transaction. Returns the comment's new counts and the deltas plus its
+        post_id, or None if the comment does not exist."""
+        raise NotImplementedError
+
+    def increment_post_counters(self, deltas):
+        """Apply {post_id: {"upvotes": n, "downvotes": m}} as atomic increments
+        in one batched write."""
+        raise NotImplementedError
+
+    # Sharded counters
+    def increment_counter(self, name, shard, amount):
+        """Add `amount` to one shard of the counter `name`."""
+        raise NotImplementedError
+
+    def get_counters(self, names, num_shards):
+        """Return {name: sum of shards} for each counter, 0 if it has none."""
+        raise NotImplementedError
+
+    def set_counter(self, name, value, num_shards):
+        """Reset a counter so its shards sum to `value`."""
+        raise NotImplementedError
+
+    def fold_counter(self, name, collection, doc_id, field, num_shards):
+        """Move the counter's shards into `field` of the document: in one
+        atomic write, add their sum to the field, take each shard's amount
+        off it and bump the document's counter_folds[field] generation. The
+        shards are read outside that write so folding never holds them
+        against increments. Returns the amount folded."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
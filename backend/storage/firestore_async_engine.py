@@ -0,0 +1,472 @@
+from google.cloud.firestore import ArrayRemove, ArrayUnion, Increment, Query, async_transactional
+
+from backend.storage.async_base import AsyncStorageEngine
+from backend.storage.base import (
+    COMMENT_SORT_FIELDS,
+    RESERVED_FIELDS,
+    ConflictError,
+    comment_ranks,
+    membership_key,
+    resolve_vote,
+    resolve_votes,
+    user_reservations,
+    vote_key,
+)
+
+
+class AsyncFirestoreStorage(AsyncStorageEngine):
+    """Storage engine backed by Firestore's native AsyncClient."""
+
+    name = "firestore"
+
+    def __init__(self, client):
+        self.db = client
+
+    async def close(self):
+        # The async transport's close() hands back a coroutine to await
+        closing = self.db.close()
+        if closing is not None:
+            await closing
+
+    async def _get(self, collection, doc_id):
+        doc = await self.db.collection(collection).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    async def _get_many(self, collection, doc_ids):
+        # One batched read; ids containing "/" aren't document ids, so can't exist
+        refs = [self.db.collection(collection).document(doc_id) for doc_id in doc_ids if doc_id and "/" not in doc_id]
+        if not refs:
+            return []
+        return [snap.to_dict() async for snap in self.db.get_all(refs) if snap.exists]
+
+    async def _find_one(self, collection, field, value):
+        docs = await self.db.collection(collection).where(field, "==", value).limit(1).get()
+        return docs[0].to_dict() if docs else None
+
+    async def _stream(self, query):
+        return [doc.to_dict() async for doc in query.stream()]
+
+    # Users
+    async def create_user(self, user):
+        user_ref = self.db.collection("users").document(user["id"])
+        reservation_refs = {
+            collection: self.db.collection(collection).document(value)
+            for collection, value in user_reservations(user).items()
+        }
+
+        @async_transactional
+        async def run(transaction):
+            # Point reads of both reservations, then one commit for all three
+            # documents; a concurrent signup for either value retries and fails
+            snapshots = {snap.reference.path: snap async for snap in await transaction.get_all(list(reservation_refs.values()))}
+            for collection, ref in reservation_refs.items():
+                snap = snapshots.get(ref.path)
+                if snap is not None and snap.exists and snap.to_dict().get("user_id") != user["id"]:
+                    raise ConflictError(RESERVED_FIELDS[collection], user.get(RESERVED_FIELDS[collection]))
+            for ref in reservation_refs.values():
+                transaction.set(ref, {"user_id": user["id"]})
+            transaction.set(user_ref, user)
+
+        await run(self.db.transaction())
+
+    async def list_users(self, fields=None):
+        query = self.db.collection("users")
+        if fields:
+            # Leaves password hashes and profiles on the server
+            query = query.select(sorted(set(fields) | {"id"}))
+        return await self._stream(query)
+
+    async def get_reservation(self, collection, value_id):
+        reservation = await self._get(collection, value_id)
+        return reservation and reservation.get("user_id")
+
+    async def get_user(self, user_id):
+        return await self._get("users", user_id)
+
+    async def get_users(self, user_ids):
+        return await self._get_many("users", user_ids)
+
+    async def get_user_by_email(self, email):
+        return await self._find_one("users", "email", email)
+
+    async def get_user_by_username(self, username):
+        return await self._find_one("users", "username", username)
+
+    # Communities
+    async def create_community(self, community):
+        await self.db.collection("communities").document(community["id"]).set(community)
+
+    async def get_community(self, community_id):
+        return await self._get("communities", community_id)
+
+    async def get_community_by_name(self, name):
+        return await self._find_one("communities", "name", name)
+
+    async def update_community(self, community_id, fields):
+        await self.db.collection("communities").document(community_id).update(fields)
+
+    async def list_communities(self):
+        return await self._stream(self.db.collection("communities"))
+
+    async def list_communities_for_member(self, user_email):
+        # Membership docs live at communities/{id}/members/{email}; one
+        # collection group query finds them, one multi-get loads the communities
+        query = self.db.collection_group("members").where("user_email", "==", user_email)
+        refs = [snap.reference.parent.parent async for snap in query.stream()]
+        if not refs:
+            return []
+        return [snap.to_dict() async for snap in self.db.get_all(refs) if snap.exists]
+
+    async def get_communities(self, community_ids):
+        return await self._get_many("communities", community_ids)
+
+    # Memberships
+    def _member_ref(self, community_id, user_email):
+        return self.db.collection("communities").document(community_id).collection("members").document(user_email)
+
+    async def _set_member(self, community_id, user_email, user_id, membership):
+        member_ref = self._member_ref(community_id, user_email)
+        user_ref = self.db.collection("users").document(user_id) if user_id else None
+
+        @async_transactional
+        async def run(transaction):
+            existing = [snap async for snap in await transaction.get_all([member_ref])]
+            exists = bool(existing) and existing[0].exists
+            if exists == (membership is not None):
+                return False
+            if membership is None:
+                transaction.delete(member_ref)
+            else:
+                transaction.set(member_ref, membership)
+            if user_ref is not None:
+                change = ArrayUnion([community_id]) if membership is not None else ArrayRemove([community_id])
+                transaction.update(user_ref, {"joined_communities": change})
+            return True
+
+        return await run(self.db.transaction())
+
+    async def add_member(self, community_id, user_email, user_id, now, read_post_count=0):
+        return await self._set_member(community_id, user_email, user_id, {
+            "id": membership_key(community_id, user_email),
+            "community_id": community_id,
+            "user_email": user_email,
+            "user_id": user_id,
+            "joined_at": now,
+            "read_post_count": read_post_count,
+        })
+
+    async def remove_member(self, community_id, user_email, user_id):
+        return await self._set_member(community_id, user_email, user_id, None)
+
+    async def get_membership(self, community_id, user_email):
+        snap = await self._member_ref(community_id, user_email).get()
+        return snap.to_dict() if snap.exists else None
+
+    async def update_membership(self, community_id, user_email, fields):
+        await self._member_ref(community_id, user_email).update(fields)
+
+    async def list_members(self, community_id):
+        return await self._stream(self.db.collection("communities").document(community_id).collection("members"))
+
+    async def list_memberships_for_member(self, user_email):
+        return await self._stream(self.db.collection_group("members").where("user_email", "==", user_email))
+
+    # Posts
+    async def create_post(self, post):
+        await self.db.collection("posts").document(post["id"]).set(post)
+
+    async def get_post(self, post_id):
+        return await self._get("posts", post_id)
+
+    async def get_posts(self, post_ids):
+        return await self._get_many("posts", post_ids)
+
+    async def update_post(self, post_id, fields):
+        await self.db.collection("posts").document(post_id).update(fields)
+
+    async def list_posts(self):
+        return await self._stream(self.db.collection("posts"))
+
+    async def list_posts_by_community(self, community_id):
+        return await self._stream(self.db.collection("posts").where("community_id", "==", community_id))
+
+    async def list_posts_page(self, order_by, limit, after=None, community_id=None, fields=None):
+        query = self.db.collection("posts")
+        if community_id:
+            query = query.where("community_id", "==", community_id)
+        query = query.order_by(order_by, direction=Query.DESCENDING).order_by("id", direction=Query.DESCENDING)
+        if after is not None:
+            query = query.start_after({order_by: after[0], "id": after[1]})
+        if fields:
+            # Only ship the requested fields (plus the sort key) over the wire
+            query = query.select(sorted(set(fields) | {order_by, "id"}))
+        return await self._stream(query.limit(limit))
+
+    # Comments
+    async def create_comment(self, comment):
+        await self.db.collection("comments").document(comment["id"]).set(comment)
+
+    async def get_comment(self, comment_id):
+        return await self._get("comments", comment_id)
+
+    async def list_comments_by_post(self, post_id):
+        return await self._stream(self.db.collection("comments").where("post_id", "==", post_id))
+
+    async def update_comment(self, comment_id, fields):
+        await self.db.collection("comments").document(comment_id).update(fields)
+
+    async def increment_comment_fields(self, comment_id, deltas):
+        await self.db.collection("comments").document(comment_id).update(
+            {field: Increment(amount) for field, amount in deltas.items()}
+        )
+
+    async def list_child_comments(self, post_id, parent_id, limit, after=None, sort="old"):
+        query = (
+            self.db.collection("comments")
+            .where("post_id", "==", post_id)
+            .where("parent_id", "==", parent_id)
+        )
+        field = COMMENT_SORT_FIELDS.get(sort)
+        if field:
+            query = query.order_by(field, direction=Query.DESCENDING).order_by("path")
+            if after is not None:
+                query = query.start_after({field: after[0], "path": after[1]})
+        else:
+            query = query.order_by("path", direction=Query.DESCENDING if sort == "new" else Query.ASCENDING)
+            if after is not None:
+                query = query.start_after({"path": after[0]})
+        return await self._stream(query.limit(limit))
+
+    async def list_comment_descendants(self, post_id, path, max_depth, limit):
+        # Every descendant's path starts with "<path>/"; "0" sorts right after
+        # "/". Depth can't be a second range filter, so it is applied here.
+        query = (
+            self.db.collection("comments")
+            .where("post_id", "==", post_id)
+            .where("path", ">", path + "/")
+            .where("path", "<", path + "0")
+            .order_by("path")
+            .limit(limit)
+        )
+        return [comment for comment in await self._stream(query) if comment.get("depth", 0) <= max_depth]
+
+    # Votes
+    async def get_vote(self, post_id, user_id):
+        return await self._get("votes", vote_key(post_id, user_id))
+
+    async def list_votes(self):
+        # Legacy votes may lack an "id" field; the document id is authoritative
+        return [{**doc.to_dict(), "id": doc.id} async for doc in self.db.collection("votes").stream()]
+
+    async def replace_votes(self, vote, old_ids):
+        votes = self.db.collection("votes")
+        batch = self.db.batch()
+        batch.set(votes.document(vote["id"]), vote)
+        for vote_id in old_ids:
+            batch.delete(votes.document(vote_id))
+        await batch.commit()
+
+    async def apply_vote(self, post_id, user_id, vote_type, now, update_counters=True):
+        post_ref = self.db.collection("posts").document(post_id)
+        vote_ref = self.db.collection("votes").document(vote_key(post_id, user_id))
+
+        @async_transactional
+        async def run(transaction):
+            # One batched read for both documents, one commit for all writes
+            snapshots = {snap.reference.path: snap async for snap in await transaction.get_all([post_ref, vote_ref])}
+            post = snapshots.get(post_ref.path)
+            if post is None or not post.exists:
+                return None
+            vote = snapshots.get(vote_ref.path)
+            existing = vote.to_dict() if vote is not None and vote.exists else None
+            post_data = post.to_dict()
+
+            existing_type = existing and existing.get("vote_type")
+            new_type, upvote_delta, downvote_delta = resolve_vote(existing_type, vote_type)
+            self._write_vote(
+                transaction, post_ref, vote_ref, user_id, existing_type, new_type,
+                upvote_delta, downvote_delta, now, update_counters,
+            )
+            return {
+                "upvotes": post_data.get("upvotes", 0) + upvote_delta,
+                "downvotes": post_data.get("downvotes", 0) + downvote_delta,
+                "upvote_delta": upvote_delta,
+                "downvote_delta": downvote_delta,
+            }
+
+        return await run(self.db.transaction())
+
+    def _write_vote(self, transaction, post_ref, vote_ref, user_id, existing_type, new_type,
+                    upvote_delta, downvote_delta, now, update_counters):
+        counters = {}
+        if upvote_delta:
+            counters["upvotes"] = Increment(upvote_delta)
+        if downvote_delta:
+            counters["downvotes"] = Increment(downvote_delta)
+        if upvote_delta != downvote_delta:
+            counters["score"] = Increment(upvote_delta - downvote_delta)
+        if counters and update_counters:
+            transaction.update(post_ref, counters)
+
+        if new_type is None:
+            transaction.delete(vote_ref)
+        elif existing_type:
+            transaction.update(vote_ref, {"vote_type": new_type, "updated_at": now})
+        else:
+            transaction.set(vote_ref, {
+                "id": vote_ref.id,
+                "post_id": post_ref.id,
+                "user_id": user_id,
+                "vote_type": new_type,
+                "created_at": now,
+                "updated_at": now,
+            })
+
+    async def apply_votes(self, user_id, votes, now, update_counters=True):
+        post_ids = list(dict.fromkeys(post_id for post_id, _ in votes))
+        post_refs = {post_id: self.db.collection("posts").document(post_id) for post_id in post_ids}
+        vote_refs = {post_id: self.db.collection("votes").document(vote_key(post_id, user_id)) for post_id in post_ids}
+
+        @async_transactional
+        async def run(transaction):
+            # One batched read for every post and vote, one commit for all writes
+            refs = [*post_refs.values(), *vote_refs.values()]
+            snapshots = {snap.reference.path: snap async for snap in await transaction.get_all(refs)}
+            posts, existing = {}, {}
+            for post_id in post_ids:
+                post = snapshots.get(post_refs[post_id].path)
+                if post is None or not post.exists:
+                    continue
+                posts[post_id] = post.to_dict()
+                vote = snapshots.get(vote_refs[post_id].path)
+                if vote is not None and vote.exists:
+                    existing[post_id] = vote.to_dict().get("vote_type")
+
+            vote_types = dict(existing)
+            results, deltas = resolve_votes(votes, posts, vote_types)
+            for post_id, (upvote_delta, downvote_delta) in deltas.items():
+                if not upvote_delta and not downvote_delta:
+                    continue  # the user's votes on this post cancelled out
+                self._write_vote(
+                    transaction, post_refs[post_id], vote_refs[post_id], user_id, existing.get(post_id),
+                    vote_types.get(post_id), upvote_delta, downvote_delta, now, update_counters,
+                )
+            return results
+
+        return await run(self.db.transaction())
+
+    async def apply_comment_vote(self, comment_id, user_id, vote_type, now):
+        comment_ref = self.db.collection("comments").document(comment_id)
+        vote_ref = self.db.collection("comment_votes").document(vote_key(comment_id, user_id))
+
+        @async_transactional
+        async def run(transaction):
+            snapshots = {snap.reference.path: snap async for snap in await transaction.get_all([comment_ref, vote_ref])}
+            comment = snapshots.get(comment_ref.path)
+            if comment is None or not comment.exists:
+                return None
+            vote = snapshots.get(vote_ref.path)
+            existing = vote.to_dict() if vote is not None and vote.exists else None
+            comment_data = comment.to_dict()
+
+            new_type, upvote_delta, downvote_delta = resolve_vote(existing and existing.get("vote_type"), vote_type)
+            upvotes = comment_data.get("upvotes", 0) + upvote_delta
+            downvotes = comment_data.get("downvotes", 0) + downvote_delta
+            # best isn't additive, so the counts are written outright; the
+            # transaction retries if another vote lands in between
+            ranks = comment_ranks(upvotes, downvotes)
+            transaction.update(comment_ref, dict(ranks, upvotes=upvotes, downvotes=downvotes))
+
+            if new_type is None:
+                transaction.delete(vote_ref)
+            elif existing:
+                transaction.update(vote_ref, {"vote_type": new_type, "updated_at": now})
+            else:
+                transaction.set(vote_ref, {
+                    "id": vote_ref.id,
+                    "comment_id": comment_id,
+                    "user_id": user_id,
+                    "vote_type": new_type,
+                    "created_at": now,
+                    "updated_at": now,
+                })
+            return dict(
+                ranks,
+                post_id=comment_data.get("post_id"),
+                upvotes=upvotes,
+                downvotes=downvotes,
+                upvote_delta=upvote_delta,
+                downvote_delta=downvote_delta,
+            )
+
+        return await run(self.db.transaction())
+
+    async def increment_post_counters(self, deltas):
+        posts = self.db.collection("posts")
+        # update() on a deleted post would fail the whole batch, and the
+        # caller would retry it forever; skip posts that no longer exist
+        refs = [posts.document(post_id) for post_id in deltas]
+        existing = {snap.id async for snap in self.db.get_all(refs, field_paths=["id"]) if snap.exists}
+        items = [(post_id, counters) for post_id, counters in deltas.items() if post_id in existing]
+        # A batched write holds at most 500 operations
+        for start in range(0, len(items), 500):
+            batch = self.db.batch()
+            for post_id, counters in items[start:start + 500]:
+                fields = {field: Increment(amount) for field, amount in counters.items() if amount}
+                score = counters.get("upvotes", 0) - counters.get("downvotes", 0)
+                if score:
+                    fields["score"] = Increment(score)
+                batch.update(posts.document(post_id), fields)
+            await batch.commit()
+
+    # Sharded counters live at counters/{name}/shards/{shard} as {"count": n}
+    def _shard_ref(self, name, shard):
+        return self.db.collection("counters").document(name).collection("shards").document(str(shard))
+
+    async def increment_counter(self, name, shard, amount):
+        await self._shard_ref(name, shard).set({"count": Increment(amount)}, merge=True)
+
+    async def get_counters(self, names, num_shards):
+        names = list(names)
+        totals = dict.fromkeys(names, 0)
+        if not names:
+            return totals
+        # Every shard of every counter in a single multi-get
+        refs = [self._shard_ref(name, shard) for name in names for shard in range(num_shards)]
+        snapshots = [snap async for snap in self.db.get_all(refs)]
+        for snap in snapshots:
+            if snap.exists:
+                name = snap.reference.parent.parent.id
+                totals[name] += snap.to_dict().get("count", 0)
+        return totals
+
+    async def set_counter(self, name, value, num_shards):
+        batch = self.db.batch()
+        for shard in range(num_shards):
+            batch.set(self._shard_ref(name, shard), {"count": value if shard == 0 else 0})
+        await batch.commit()
+
+    async def fold_counter(self, name, collection, doc_id, field, num_shards):
+        doc_ref = self.db.collection(collection).document(doc_id)
+        shard_refs = [self._shard_ref(name, shard) for shard in range(num_shards)]
+        # Plain reads, not a transaction: holding every shard would contend
+        # with the increments the shards exist to spread out. Subtracting what
+        # was read keeps increments made in between.
+        snapshots = [snap async for snap in self.db.get_all([doc_ref, *shard_refs])]
+        doc = next((snap for snap in snapshots if snap.reference.path == doc_ref.path), None)
+        shards = [
+            (snap.reference, snap.to_dict().get("count", 0))
+            for snap in snapshots
+            if snap.exists and snap.reference.path != doc_ref.path
+        ]
+        amount = sum(count for _, count in shards)
+        if not amount:
+            return 0
+        batch = self.db.batch()
+        if doc is not None and doc.exists:
+            batch.update(doc_ref, {field: Increment(amount), f"counter_folds.{field}": Increment(1)})
+        for ref, count in shards:
+            if count:
+                batch.set(ref, {"count": Increment(-count)}, merge=True)
+        await batch.commit()
+        return amount
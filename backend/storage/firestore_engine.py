@@ -0,0 +1,14 @@
+from backend.storage.async_base import SyncStorageAdapter
+from backend.storage.firestore_async_engine import AsyncFirestoreStorage
+
+
+class FirestoreStorage(SyncStorageAdapter):
+    """Synchronous Firestore engine for the maintenance commands.
+
+    Runs AsyncFirestoreStorage on a private event loop, so the queries and
+    transactions are written once. `create_client` returns a Firestore
+    AsyncClient and is called on that loop.
+    """
+
+    def __init__(self, create_client):
+        super().__init__(lambda: AsyncFirestoreStorage(create_client()))
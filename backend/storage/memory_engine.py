@@ -0,0 +1,495 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+
+from backend.storage.base import (
+    COMMENT_SORT_FIELDS,
+    RESERVED_FIELDS,
+    ConflictError,
+    StorageEngine,
+    comment_ranks,
+    membership_key,
+    resolve_vote,
+    resolve_votes,
+    user_reservations,
+    vote_key,
+)
+
+
+def _copy(doc):
+    # Handlers mutate what they get back (e.g. adding "replies" or deleting
+    # "password"), so never hand out the stored dict or its lists.
+    if doc is None:
+        return None
+    return {
+        key: list(value) if isinstance(value, list) else dict(value) if isinstance(value, dict) else value
+        for key, value in doc.items()
+    }
+
+
+class MemoryStorage(StorageEngine):
+    """In-process storage engine for tests and benchmarks.
+
+    Documents live in dicts keyed by id, and every equality lookup the API
+    performs has a secondary hash index, so none of them scan a collection.
+    """
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.users = {}
+        self.communities = {}
+        self.posts = {}
+        self.comments = {}
+        # Keyed by vote_key(post_id, user_id), which doubles as the
+        # (post_id, user_id) index
+        self.votes = {}
+        self.comment_votes = {}
+        # Keyed by membership_key(community_id, user_email)
+        self.memberships = {}
+        # (reservation collection, normalized value) -> user id
+        self.reservations = {}
+
+        self.users_by_email = {}
+        self.users_by_username = {}
+        self.communities_by_name = {}
+        self.communities_by_member = defaultdict(set)
+        self.members_by_community = defaultdict(set)
+        self.posts_by_community = defaultdict(dict)
+        # (community_id or None, order_by) -> sorted [(value, post_id)], so
+        # list_posts_page slices a page instead of sorting every post
+        self.post_order = defaultdict(list)
+        self.comments_by_post = defaultdict(dict)
+        # post_id -> sorted [(path, comment_id)], for subtree range scans
+        self.comment_paths = defaultdict(list)
+        # (post_id, parent_id) -> sorted [(path, comment_id)]
+        self.comment_children = defaultdict(list)
+        # (post_id, parent_id, sort) -> sorted [(-value, path, comment_id)]
+        # for the "top" and "best" orders
+        self.comment_ranked = defaultdict(list)
+        # counter name -> {shard: count}
+        self.counters = defaultdict(dict)
+
+    # Users
+    def create_user(self, user):
+        user = _copy(user)
+        with self.lock:
+            keys = list(user_reservations(user).items())
+            for collection, value in keys:
+                holder = self.reservations.get((collection, value))
+                if holder is not None and holder != user["id"]:
+                    raise ConflictError(RESERVED_FIELDS[collection], user.get(RESERVED_FIELDS[collection]))
+            for key in keys:
+                self.reservations[key] = user["id"]
+            self.users[user["id"]] = user
+            self.users_by_email[user.get("email")] = user["id"]
+            self.users_by_username[user.get("username")] = user["id"]
+
+    def list_users(self, fields=None):
+        if fields:
+            return [{field: user.get(field) for field in ("id", *fields)} for user in list(self.users.values())]
+        return [_copy(user) for user in list(self.users.values())]
+
+    def get_reservation(self, collection, value_id):
+        return self.reservations.get((collection, value_id))
+
+    def get_user(self, user_id):
+        return _copy(self.users.get(user_id))
+
+    def get_users(self, user_ids):
+        return [_copy(self.users[user_id]) for user_id in user_ids if user_id in self.users]
+
+    def get_user_by_email(self, email):
+        return _copy(self.users.get(self.users_by_email.get(email)))
+
+    def get_user_by_username(self, username):
+        return _copy(self.users.get(self.users_by_username.get(username)))
+
+    # Communities
+    def _index_community(self, community):
+        self.communities_by_name[community.get("name")] = community["id"]
+
+    def _unindex_community(self, community):
+        if self.communities_by_name.get(community.get("name")) == community["id"]:
+            del self.communities_by_name[community.get("name")]
+
+    def create_community(self, community):
+        community = _copy(community)
+        with self.lock:
+            self.communities[community["id"]] = community
+            self._index_community(community)
+
+    def get_community(self, community_id):
+        return _copy(self.communities.get(community_id))
+
+    def get_community_by_name(self, name):
+        return _copy(self.communities.get(self.communities_by_name.get(name)))
+
+    def update_community(self, community_id, fields):
+        with self.lock:
+            community = self.communities[community_id]
+            self._unindex_community(community)
+            community.update(_copy(fields))
+            self._index_community(community)
+
+    def list_communities(self):
+        return [_copy(community) for community in list(self.communities.values())]
+
+    def list_communities_for_member(self, user_email):
+        return [
+            _copy(self.communities[community_id])
+            for community_id in list(self.communities_by_member.get(user_email, ()))
+            if community_id in self.communities
+        ]
+
+    def get_communities(self, community_ids):
+        return [_copy(self.communities[community_id]) for community_id in community_ids if community_id in self.communities]
+
+    # Memberships
+    def add_member(self, community_id, user_email, user_id, now, read_post_count=0):
+        key = membership_key(community_id, user_email)
+        with self.lock:
+            if key in self.memberships:
+                return False
+            self.memberships[key] = {
+                "id": key,
+                "community_id": community_id,
+                "user_email": user_email,
+                "user_id": user_id,
+                "joined_at": now,
+                "read_post_count": read_post_count,
+            }
+            self.communities_by_member[user_email].add(community_id)
+            self.members_by_community[community_id].add(user_email)
+            user = self.users.get(user_id)
+            if user is not None and community_id not in user.setdefault("joined_communities", []):
+                user["joined_communities"].append(community_id)
+            return True
+
+    def remove_member(self, community_id, user_email, user_id):
+        key = membership_key(community_id, user_email)
+        with self.lock:
+            if self.memberships.pop(key, None) is None:
+                return False
+            self.communities_by_member[user_email].discard(community_id)
+            self.members_by_community[community_id].discard(user_email)
+            user = self.users.get(user_id)
+            if user is not None and community_id in user.get("joined_communities", []):
+                user["joined_communities"].remove(community_id)
+            return True
+
+    def get_membership(self, community_id, user_email):
+        return _copy(self.memberships.get(membership_key(community_id, user_email)))
+
+    def update_membership(self, community_id, user_email, fields):
+        with self.lock:
+            self.memberships[membership_key(community_id, user_email)].update(_copy(fields))
+
+    def list_members(self, community_id):
+        return [
+            _copy(self.memberships[membership_key(community_id, user_email)])
+            for user_email in list(self.members_by_community.get(community_id, ()))
+        ]
+
+    def list_memberships_for_member(self, user_email):
+        return [
+            _copy(self.memberships[membership_key(community_id, user_email)])
+            for community_id in list(self.communities_by_member.get(user_email, ()))
+        ]
+
+    # Posts
+    def _post_index_keys(self, post):
+        for order_by, default in (("created_at", ""), ("score", 0)):
+            key = (post.get(order_by, default), post["id"])
+            yield self.post_order[(None, order_by)], key
+            yield self.post_order[(post.get("community_id"), order_by)], key
+
+    def _index_post(self, post):
+        for keys, key in self._post_index_keys(post):
+            insort(keys, key)
+
+    def _unindex_post(self, post):
+        for keys, key in self._post_index_keys(post):
+            index = bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                del keys[index]
+
+    def create_post(self, post):
+        post = _copy(post)
+        with self.lock:
+            old = self.posts.get(post["id"])
+            if old is not None:
+                self._unindex_post(old)
+            self.posts[post["id"]] = post
+            self.posts_by_community[post.get("community_id")][post["id"]] = post
+            self._index_post(post)
+
+    def get_post(self, post_id):
+        return _copy(self.posts.get(post_id))
+
+    def get_posts(self, post_ids):
+        return [_copy(self.posts[post_id]) for post_id in post_ids if post_id in self.posts]
+
+    def update_post(self, post_id, fields):
+        with self.lock:
+            post = self.posts[post_id]
+            self._unindex_post(post)
+            post.update(_copy(fields))
+            self._index_post(post)
+
+    def list_posts(self):
+        return [_copy(post) for post in list(self.posts.values())]
+
+    def list_posts_by_community(self, community_id):
+        return [_copy(post) for post in list(self.posts_by_community.get(community_id, {}).values())]
+
+    def list_posts_page(self, order_by, limit, after=None, community_id=None, fields=None):
+        with self.lock:
+            keys = self.post_order.get((community_id or None, order_by), [])
+            # Descending order: the page is the `limit` keys just below the cursor
+            end = bisect_left(keys, tuple(after)) if after is not None else len(keys)
+            page = keys[max(0, end - limit):end]
+            return [_copy(self.posts[post_id]) for _, post_id in reversed(page)]
+
+    # Comments
+    def create_comment(self, comment):
+        comment = _copy(comment)
+        with self.lock:
+            self.comments[comment["id"]] = comment
+            self.comments_by_post[comment.get("post_id")][comment["id"]] = comment
+            self._index_comment_path(comment)
+
+    def _comment_index_keys(self, comment):
+        post_id, parent_id = comment["post_id"], comment.get("parent_id")
+        key = (comment["path"], comment["id"])
+        yield self.comment_paths[post_id], key
+        yield self.comment_children[(post_id, parent_id)], key
+        for sort, field in COMMENT_SORT_FIELDS.items():
+            yield self.comment_ranked[(post_id, parent_id, sort)], (-(comment.get(field) or 0),) + key
+
+    def _index_comment_path(self, comment):
+        if comment.get("path") is None:
+            return
+        for keys, key in self._comment_index_keys(comment):
+            insort(keys, key)
+
+    def _unindex_comment_path(self, comment):
+        if comment.get("path") is None:
+            return
+        for keys, key in self._comment_index_keys(comment):
+            index = bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                del keys[index]
+
+    def get_comment(self, comment_id):
+        return _copy(self.comments.get(comment_id))
+
+    def list_comments_by_post(self, post_id):
+        return [_copy(comment) for comment in list(self.comments_by_post.get(post_id, {}).values())]
+
+    def update_comment(self, comment_id, fields):
+        with self.lock:
+            comment = self.comments[comment_id]
+            self._unindex_comment_path(comment)
+            comment.update(_copy(fields))
+            self._index_comment_path(comment)
+
+    def increment_comment_fields(self, comment_id, deltas):
+        with self.lock:
+            comment = self.comments.get(comment_id)
+            if comment is None:
+                return
+            self._unindex_comment_path(comment)
+            for field, amount in deltas.items():
+                comment[field] = comment.get(field, 0) + amount
+            self._index_comment_path(comment)
+
+    def list_child_comments(self, post_id, parent_id, limit, after=None, sort="old"):
+        if sort == "new":
+            keys = self.comment_children.get((post_id, parent_id), [])
+            end = bisect_left(keys, (after[0], "")) if after is not None else len(keys)
+            page = keys[max(0, end - limit):end][::-1]
+        else:
+            if sort == "old":
+                keys = self.comment_children.get((post_id, parent_id), [])
+            else:
+                keys = self.comment_ranked.get((post_id, parent_id, sort), [])
+            start = 0
+            if after is not None:
+                # after is [path], or [value, path] for the ranked orders
+                bound = (after[0],) if sort == "old" else (-after[0], after[1])
+                start = bisect_right(keys, bound + ("\uffff",))
+            page = keys[start:start + limit]
+        return [_copy(self.comments[key[-1]]) for key in page]
+
+    def list_comment_descendants(self, post_id, path, max_depth, limit):
+        keys = self.comment_paths.get(post_id, [])
+        prefix = path + "/"
+        results = []
+        for index in range(bisect_left(keys, (prefix, "")), len(keys)):
+            descendant_path, comment_id = keys[index]
+            if not descendant_path.startswith(prefix):
+                break
+            comment = self.comments[comment_id]
+            if comment.get("depth", 0) <= max_depth:
+                results.append(_copy(comment))
+                if len(results) >= limit:
+                    break
+        return results
+
+    # Votes
+    def get_vote(self, post_id, user_id):
+        return _copy(self.votes.get(vote_key(post_id, user_id)))
+
+    def list_votes(self):
+        return [_copy(vote) for vote in list(self.votes.values())]
+
+    def replace_votes(self, vote, old_ids):
+        with self.lock:
+            for vote_id in old_ids:
+                self.votes.pop(vote_id, None)
+            self.votes[vote["id"]] = _copy(vote)
+
+    def apply_vote(self, post_id, user_id, vote_type, now, update_counters=True):
+        with self.lock:
+            post = self.posts.get(post_id)
+            if post is None:
+                return None
+            key = vote_key(post_id, user_id)
+            existing = self.votes.get(key)
+            new_type, upvote_delta, downvote_delta = resolve_vote(existing and existing.get("vote_type"), vote_type)
+            upvotes = post.get("upvotes", 0) + upvote_delta
+            downvotes = post.get("downvotes", 0) + downvote_delta
+            if update_counters:
+                self._unindex_post(post)
+                post["upvotes"] = upvotes
+                post["downvotes"] = downvotes
+                post["score"] = upvotes - downvotes
+                self._index_post(post)
+
+            if new_type is None:
+                self.votes.pop(key, None)
+            elif existing:
+                existing.update({"vote_type": new_type, "updated_at": now})
+            else:
+                self.votes[key] = {
+                    "id": key,
+                    "post_id": post_id,
+                    "user_id": user_id,
+                    "vote_type": new_type,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            return {
+                "upvotes": upvotes,
+                "downvotes": downvotes,
+                "upvote_delta": upvote_delta,
+                "downvote_delta": downvote_delta,
+            }
+
+    def apply_votes(self, user_id, votes, now, update_counters=True):
+        with self.lock:
+            posts = {post_id: self.posts[post_id] for post_id, _ in votes if post_id in self.posts}
+            existing = {post_id: self.votes.get(vote_key(post_id, user_id)) for post_id in posts}
+            vote_types = {post_id: vote["vote_type"] for post_id, vote in existing.items() if vote}
+            results, deltas = resolve_votes(votes, posts, vote_types)
+
+            for post_id, (upvote_delta, downvote_delta) in deltas.items():
+                if not upvote_delta and not downvote_delta:
+                    continue  # the user's votes on this post cancelled out
+                if update_counters:
+                    post = posts[post_id]
+                    self._unindex_post(post)
+                    post["upvotes"] = post.get("upvotes", 0) + upvote_delta
+                    post["downvotes"] = post.get("downvotes", 0) + downvote_delta
+                    post["score"] = post["upvotes"] - post["downvotes"]
+                    self._index_post(post)
+                key = vote_key(post_id, user_id)
+                if vote_types[post_id] is None:
+                    self.votes.pop(key, None)
+                elif existing[post_id]:
+                    existing[post_id].update({"vote_type": vote_types[post_id], "updated_at": now})
+                else:
+                    self.votes[key] = {
+                        "id": key,
+                        "post_id": post_id,
+                        "user_id": user_id,
+                        "vote_type": vote_types[post_id],
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+            return results
+
+    def apply_comment_vote(self, comment_id, user_id, vote_type, now):
+        with self.lock:
+            comment = self.comments.get(comment_id)
+            if comment is None:
+                return None
+            key = vote_key(comment_id, user_id)
+            existing = self.comment_votes.get(key)
+            new_type, upvote_delta, downvote_delta = resolve_vote(existing and existing.get("vote_type"), vote_type)
+            upvotes = comment.get("upvotes", 0) + upvote_delta
+            downvotes = comment.get("downvotes", 0) + downvote_delta
+            ranks = comment_ranks(upvotes, downvotes)
+            self._unindex_comment_path(comment)
+            comment.update(ranks, upvotes=upvotes, downvotes=downvotes)
+            self._index_comment_path(comment)
+
+            if new_type is None:
+                self.comment_votes.pop(key, None)
+            elif existing:
+                existing.update({"vote_type": new_type, "updated_at": now})
+            else:
+                self.comment_votes[key] = {
+                    "id": key,
+                    "comment_id": comment_id,
+                    "user_id": user_id,
+                    "vote_type": new_type,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+            return dict(
+                ranks,
+                post_id=comment["post_id"],
+                upvotes=upvotes,
+                downvotes=downvotes,
+                upvote_delta=upvote_delta,
+                downvote_delta=downvote_delta,
+            )
+
+    def increment_post_counters(self, deltas):
+        with self.lock:
+            for post_id, counters in deltas.items():
+                post = self.posts.get(post_id)
+                if post is None:
+                    continue
+                self._unindex_post(post)
+                for field, amount in counters.items():
+                    post[field] = post.get(field, 0) + amount
+                post["score"] = post.get("upvotes", 0) - post.get("downvotes", 0)
+                self._index_post(post)
+
+    # Sharded counters
+    def increment_counter(self, name, shard, amount):
+        with self.lock:
+            shards = self.counters[name]
+            shards[shard] = shards.get(shard, 0) + amount
+
+    def get_counters(self, names, num_shards):
+        return {name: sum(self.counters[name].values()) if name in self.counters else 0 for name in names}
+
+    def set_counter(self, name, value, num_shards):
+        with self.lock:
+            self.counters[name] = {0: value}
+
+    def fold_counter(self, name, collection, doc_id, field, num_shards):
+        with self.lock:
+            amount = sum(self.counters.pop(name, {}).values())
+            doc = getattr(self, collection).get(doc_id)
+            if doc is not None and amount:
+                doc[field] = doc.get(field, 0) + amount
+                folds = doc.setdefault("counter_folds", {})
+                folds[field] = folds.get(field, 0) + 1
+            return amount
@@ -0,0 +1,648 @@
+import json
+import sqlite3
+import threading
+
+from backend.storage.base import (
+    COMMENT_SORT_FIELDS,
+    RESERVED_FIELDS,
+    ConflictError,
+    StorageEngine,
+    comment_ranks,
+    membership_key,
+    resolve_vote,
+    resolve_votes,
+    user_reservations,
+    vote_key,
+)
+
+# Each table keeps the full document as JSON in `data` and copies the fields
+# we query on into real columns so SQLite can index them.
+TABLES = {
+    "users": ("email", "username"),
+    "communities": ("name",),
+    "posts": ("community_id", "created_at", "score"),
+    "comments": ("post_id", "parent_id", "created_at", "path", "depth", "score", "best"),
+    "votes": ("post_id", "user_id"),
+    "comment_votes": ("comment_id", "user_id"),
+    "memberships": ("community_id", "user_email"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, email TEXT, username TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users (email);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+
+-- Uniqueness reservations: one row per (collection, normalized value)
+CREATE TABLE IF NOT EXISTS reservations (collection TEXT NOT NULL, value TEXT NOT NULL, user_id TEXT NOT NULL, PRIMARY KEY (collection, value));
+
+CREATE TABLE IF NOT EXISTS communities (id TEXT PRIMARY KEY, name TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_communities_name ON communities (name);
+
+CREATE TABLE IF NOT EXISTS posts (id TEXT PRIMARY KEY, community_id TEXT, created_at TEXT, score INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_posts_community_id ON posts (community_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_posts_score ON posts (score, id);
+CREATE INDEX IF NOT EXISTS idx_posts_community_score ON posts (community_id, score, id);
+
+CREATE TABLE IF NOT EXISTS comments (id TEXT PRIMARY KEY, post_id TEXT, parent_id TEXT, created_at TEXT, path TEXT, depth INTEGER, score INTEGER, best REAL, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_comments_post_id ON comments (post_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_comments_path ON comments (post_id, path);
+CREATE INDEX IF NOT EXISTS idx_comments_children ON comments (post_id, parent_id, path);
+CREATE INDEX IF NOT EXISTS idx_comments_top ON comments (post_id, parent_id, score DESC, path);
+CREATE INDEX IF NOT EXISTS idx_comments_best ON comments (post_id, parent_id, best DESC, path);
+
+CREATE TABLE IF NOT EXISTS votes (id TEXT PRIMARY KEY, post_id TEXT, user_id TEXT, data TEXT NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_votes_post_user ON votes (post_id, user_id);
+
+CREATE TABLE IF NOT EXISTS comment_votes (id TEXT PRIMARY KEY, comment_id TEXT, user_id TEXT, data TEXT NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_comment_votes_comment_user ON comment_votes (comment_id, user_id);
+
+CREATE TABLE IF NOT EXISTS memberships (id TEXT PRIMARY KEY, community_id TEXT, user_email TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_memberships_community ON memberships (community_id);
+CREATE INDEX IF NOT EXISTS idx_memberships_user ON memberships (user_email);
+
+CREATE TABLE IF NOT EXISTS counter_shards (name TEXT NOT NULL, shard INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (name, shard));
+"""
+
+
+class SQLiteStorage(StorageEngine):
+    """Storage engine backed by a single SQLite database file.
+
+    FastAPI runs sync handlers on a threadpool, so one connection is shared
+    across threads and every statement goes through a lock.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path="campus_connect.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+
+    def _columns(self, table):
+        return [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    def _migrate(self):
+        # Databases created before posts had a score column
+        columns = self._columns("posts")
+        if columns and "score" not in columns:
+            self.conn.execute("ALTER TABLE posts ADD COLUMN score INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute(
+                "UPDATE posts SET score = coalesce(json_extract(data, '$.upvotes'), 0) "
+                "- coalesce(json_extract(data, '$.downvotes'), 0)"
+            )
+        # ... and before comments had a materialized path
+        columns = self._columns("comments")
+        if columns and "path" not in columns:
+            self.conn.execute("ALTER TABLE comments ADD COLUMN path TEXT")
+            self.conn.execute("ALTER TABLE comments ADD COLUMN depth INTEGER")
+        # ... and before comments had score / best sort columns
+        if columns and "best" not in columns:
+            self.conn.execute("ALTER TABLE comments ADD COLUMN score INTEGER")
+            self.conn.execute("ALTER TABLE comments ADD COLUMN best REAL")
+            rows = self.conn.execute("SELECT id, data FROM comments").fetchall()
+            for comment_id, data in rows:
+                comment = json.loads(data)
+                comment.update(comment_ranks(comment.get("upvotes", 0), comment.get("downvotes", 0)))
+                self.conn.execute(
+                    "UPDATE comments SET score = ?, best = ?, data = ? WHERE id = ?",
+                    (comment["score"], comment["best"], json.dumps(comment), comment_id),
+                )
+
+    def _row_values(self, table, doc):
+        return [doc["id"]] + [doc.get(column) for column in TABLES[table]] + [json.dumps(doc)]
+
+    def _insert(self, table, doc):
+        columns = ("id",) + TABLES[table] + ("data",)
+        placeholders = ", ".join("?" for _ in columns)
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                self._row_values(table, doc),
+            )
+
+    def _get(self, table, doc_id):
+        with self.lock:
+            row = self.conn.execute(f"SELECT data FROM {table} WHERE id = ?", (doc_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _get_many(self, table, doc_ids):
+        doc_ids = list(doc_ids)
+        docs = []
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            docs.extend(self._select(f"SELECT data FROM {table} WHERE id IN ({placeholders})", chunk))
+        return docs
+
+    def _find_one(self, table, column, value):
+        with self.lock:
+            row = self.conn.execute(f"SELECT data FROM {table} WHERE {column} = ? LIMIT 1", (value,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _select(self, sql, params=()):
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _update(self, table, doc_id, fields):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(f"SELECT data FROM {table} WHERE id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    raise KeyError(f"{table}/{doc_id} not found")
+                doc = json.loads(row[0])
+                doc.update(fields)
+                assignments = ", ".join(f"{column} = ?" for column in TABLES[table])
+                values = [doc.get(column) for column in TABLES[table]]
+                self.conn.execute(
+                    f"UPDATE {table} SET {assignments}, data = ? WHERE id = ?",
+                    values + [json.dumps(doc), doc_id],
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _delete(self, table, doc_id):
+        with self.lock:
+            self.conn.execute(f"DELETE FROM {table} WHERE id = ?", (doc_id,))
+
+    # Users
+    def create_user(self, user):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for collection, value in user_reservations(user).items():
+                    row = self.conn.execute(
+                        "SELECT user_id FROM reservations WHERE collection = ? AND value = ?", (collection, value)
+                    ).fetchone()
+                    if row is not None and row[0] != user["id"]:
+                        raise ConflictError(RESERVED_FIELDS[collection], user.get(RESERVED_FIELDS[collection]))
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO reservations (collection, value, user_id) VALUES (?, ?, ?)",
+                        (collection, value, user["id"]),
+                    )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO users (id, email, username, data) VALUES (?, ?, ?, ?)",
+                    self._row_values("users", user),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def list_users(self, fields=None):
+        if fields:
+            # Only the requested fields are decoded
+            fields = ["id", *fields]
+            pairs = ", ".join("?, json_extract(data, ?)" for _ in fields)
+            params = [value for field in fields for value in (field, f"$.{field}")]
+            return self._select(f"SELECT json_object({pairs}) FROM users", params)
+        return self._select("SELECT data FROM users")
+
+    def get_reservation(self, collection, value_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT user_id FROM reservations WHERE collection = ? AND value = ?", (collection, value_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_user(self, user_id):
+        return self._get("users", user_id)
+
+    def get_users(self, user_ids):
+        return self._get_many("users", user_ids)
+
+    def get_user_by_email(self, email):
+        return self._find_one("users", "email", email)
+
+    def get_user_by_username(self, username):
+        return self._find_one("users", "username", username)
+
+    # Communities
+    def create_community(self, community):
+        self._insert("communities", community)
+
+    def get_community(self, community_id):
+        return self._get("communities", community_id)
+
+    def get_community_by_name(self, name):
+        return self._find_one("communities", "name", name)
+
+    def update_community(self, community_id, fields):
+        self._update("communities", community_id, fields)
+
+    def list_communities(self):
+        return self._select("SELECT data FROM communities")
+
+    def list_communities_for_member(self, user_email):
+        return self._select(
+            "SELECT communities.data FROM memberships JOIN communities ON communities.id = memberships.community_id "
+            "WHERE memberships.user_email = ?",
+            (user_email,),
+        )
+
+    def get_communities(self, community_ids):
+        return self._get_many("communities", community_ids)
+
+    # Memberships
+    def _set_joined(self, user_id, community_id, joined):
+        # Keep the user's joined_communities in step; runs inside the caller's transaction
+        row = self.conn.execute("SELECT data FROM users WHERE id = ?", (user_id,)).fetchone()
+        if row is None:
+            return
+        user = json.loads(row[0])
+        communities = [joined_id for joined_id in user.get("joined_communities", []) if joined_id != community_id]
+        if joined:
+            communities.append(community_id)
+        user["joined_communities"] = communities
+        self.conn.execute("UPDATE users SET data = ? WHERE id = ?", (json.dumps(user), user_id))
+
+    def add_member(self, community_id, user_email, user_id, now, read_post_count=0):
+        key = membership_key(community_id, user_email)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.conn.execute("SELECT 1 FROM memberships WHERE id = ?", (key,)).fetchone():
+                    self.conn.execute("ROLLBACK")
+                    return False
+                membership = {
+                    "id": key,
+                    "community_id": community_id,
+                    "user_email": user_email,
+                    "user_id": user_id,
+                    "joined_at": now,
+                    "read_post_count": read_post_count,
+                }
+                self.conn.execute(
+                    "INSERT INTO memberships (id, community_id, user_email, data) VALUES (?, ?, ?, ?)",
+                    self._row_values("memberships", membership),
+                )
+                if user_id:
+                    self._set_joined(user_id, community_id, True)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def remove_member(self, community_id, user_email, user_id):
+        key = membership_key(community_id, user_email)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.conn.execute("DELETE FROM memberships WHERE id = ?", (key,)).rowcount == 0:
+                    self.conn.execute("ROLLBACK")
+                    return False
+                if user_id:
+                    self._set_joined(user_id, community_id, False)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def get_membership(self, community_id, user_email):
+        return self._get("memberships", membership_key(community_id, user_email))
+
+    def update_membership(self, community_id, user_email, fields):
+        self._update("memberships", membership_key(community_id, user_email), fields)
+
+    def list_members(self, community_id):
+        return self._select("SELECT data FROM memberships WHERE community_id = ?", (community_id,))
+
+    def list_memberships_for_member(self, user_email):
+        return self._select("SELECT data FROM memberships WHERE user_email = ?", (user_email,))
+
+    # Posts
+    def create_post(self, post):
+        self._insert("posts", post)
+
+    def get_post(self, post_id):
+        return self._get("posts", post_id)
+
+    def get_posts(self, post_ids):
+        return self._get_many("posts", post_ids)
+
+    def update_post(self, post_id, fields):
+        self._update("posts", post_id, fields)
+
+    def list_posts(self):
+        return self._select("SELECT data FROM posts")
+
+    def list_posts_by_community(self, community_id):
+        return self._select("SELECT data FROM posts WHERE community_id = ?", (community_id,))
+
+    def list_posts_page(self, order_by, limit, after=None, community_id=None, fields=None):
+        if order_by not in ("created_at", "score"):
+            raise ValueError(f"Cannot order posts by {order_by}")
+        clauses, params = [], []
+        if community_id:
+            clauses.append("community_id = ?")
+            params.append(community_id)
+        if after is not None:
+            clauses.append(f"({order_by} < ? OR ({order_by} = ? AND id < ?))")
+            params.extend([after[0], after[0], after[1]])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._select(
+            f"SELECT data FROM posts {where} ORDER BY {order_by} DESC, id DESC LIMIT ?",
+            params + [limit],
+        )
+
+    # Comments
+    def create_comment(self, comment):
+        self._insert("comments", comment)
+
+    def get_comment(self, comment_id):
+        return self._get("comments", comment_id)
+
+    def list_comments_by_post(self, post_id):
+        return self._select("SELECT data FROM comments WHERE post_id = ?", (post_id,))
+
+    def update_comment(self, comment_id, fields):
+        self._update("comments", comment_id, fields)
+
+    def increment_comment_fields(self, comment_id, deltas):
+        assignments, params = [], []
+        for field, amount in deltas.items():
+            assignments.append(f"'$.{field}', coalesce(json_extract(data, '$.{field}'), 0) + ?")
+            params.append(amount)
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE comments SET data = json_set(data, {', '.join(assignments)}) WHERE id = ?",
+                params + [comment_id],
+            )
+
+    def list_child_comments(self, post_id, parent_id, limit, after=None, sort="old"):
+        clauses, params = ["post_id = ?"], [post_id]
+        if parent_id is None:
+            clauses.append("parent_id IS NULL")
+        else:
+            clauses.append("parent_id = ?")
+            params.append(parent_id)
+        field = COMMENT_SORT_FIELDS.get(sort)
+        if field:
+            order = f"{field} DESC, path"
+            if after is not None:
+                clauses.append(f"({field} < ? OR ({field} = ? AND path > ?))")
+                params.extend([after[0], after[0], after[1]])
+        elif sort == "new":
+            order = "path DESC"
+            if after is not None:
+                clauses.append("path < ?")
+                params.append(after[0])
+        else:
+            order = "path"
+            if after is not None:
+                clauses.append("path > ?")
+                params.append(after[0])
+        return self._select(
+            f"SELECT data FROM comments WHERE {' AND '.join(clauses)} ORDER BY {order} LIMIT ?",
+            params + [limit],
+        )
+
+    def list_comment_descendants(self, post_id, path, max_depth, limit):
+        # Every descendant's path starts with "<path>/"; "0" sorts right after "/"
+        return self._select(
+            "SELECT data FROM comments WHERE post_id = ? AND path > ? AND path < ? AND depth <= ? "
+            "ORDER BY path LIMIT ?",
+            (post_id, path + "/", path + "0", max_depth, limit),
+        )
+
+    # Votes
+    def get_vote(self, post_id, user_id):
+        return self._get("votes", vote_key(post_id, user_id))
+
+    def list_votes(self):
+        return self._select("SELECT data FROM votes")
+
+    def replace_votes(self, vote, old_ids):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Deleted first: (post_id, user_id) is unique
+                self.conn.executemany("DELETE FROM votes WHERE id = ?", [(vote_id,) for vote_id in old_ids])
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO votes (id, post_id, user_id, data) VALUES (?, ?, ?, ?)",
+                    self._row_values("votes", vote),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def apply_vote(self, post_id, user_id, vote_type, now, update_counters=True):
+        key = vote_key(post_id, user_id)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                post_row = self.conn.execute("SELECT data FROM posts WHERE id = ?", (post_id,)).fetchone()
+                if post_row is None:
+                    self.conn.execute("ROLLBACK")
+                    return None
+                post = json.loads(post_row[0])
+                vote_row = self.conn.execute("SELECT data FROM votes WHERE id = ?", (key,)).fetchone()
+                existing = json.loads(vote_row[0]) if vote_row else None
+
+                new_type, upvote_delta, downvote_delta = resolve_vote(existing and existing.get("vote_type"), vote_type)
+                upvotes = post.get("upvotes", 0) + upvote_delta
+                downvotes = post.get("downvotes", 0) + downvote_delta
+                if update_counters:
+                    self.conn.execute(
+                        "UPDATE posts SET score = ?, data = json_set(data, '$.upvotes', ?, '$.downvotes', ?, '$.score', ?) "
+                        "WHERE id = ?",
+                        (upvotes - downvotes, upvotes, downvotes, upvotes - downvotes, post_id),
+                    )
+
+                if new_type is None:
+                    self.conn.execute("DELETE FROM votes WHERE id = ?", (key,))
+                else:
+                    vote = existing or {"id": key, "post_id": post_id, "user_id": user_id, "created_at": now}
+                    vote.update({"vote_type": new_type, "updated_at": now})
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO votes (id, post_id, user_id, data) VALUES (?, ?, ?, ?)",
+                        self._row_values("votes", vote),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return {
+            "upvotes": upvotes,
+            "downvotes": downvotes,
+            "upvote_delta": upvote_delta,
+            "downvote_delta": downvote_delta,
+        }
+
+    def apply_votes(self, user_id, votes, now, update_counters=True):
+        post_ids = list(dict.fromkeys(post_id for post_id, _ in votes))
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                posts = {post["id"]: post for post in self._get_many("posts", post_ids)}
+                existing = {
+                    vote["post_id"]: vote
+                    for vote in self._get_many("votes", [vote_key(post_id, user_id) for post_id in posts])
+                }
+                vote_types = {post_id: vote.get("vote_type") for post_id, vote in existing.items()}
+                results, deltas = resolve_votes(votes, posts, vote_types)
+
+                for post_id, (upvote_delta, downvote_delta) in deltas.items():
+                    if not upvote_delta and not downvote_delta:
+                        continue  # the user's votes on this post cancelled out
+                    if update_counters:
+                        upvotes = posts[post_id].get("upvotes", 0) + upvote_delta
+                        downvotes = posts[post_id].get("downvotes", 0) + downvote_delta
+                        self.conn.execute(
+                            "UPDATE posts SET score = ?, data = json_set(data, '$.upvotes', ?, '$.downvotes', ?, '$.score', ?) "
+                            "WHERE id = ?",
+                            (upvotes - downvotes, upvotes, downvotes, upvotes - downvotes, post_id),
+                        )
+                    key = vote_key(post_id, user_id)
+                    if vote_types[post_id] is None:
+                        self.conn.execute("DELETE FROM votes WHERE id = ?", (key,))
+                    else:
+                        vote = existing.get(post_id) or {"id": key, "post_id": post_id, "user_id": user_id, "created_at": now}
+                        vote.update({"vote_type": vote_types[post_id], "updated_at": now})
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO votes (id, post_id, user_id, data) VALUES (?, ?, ?, ?)",
+                            self._row_values("votes", vote),
+                        )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return results
+
+    def apply_comment_vote(self, comment_id, user_id, vote_type, now):
+        key = vote_key(comment_id, user_id)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                comment_row = self.conn.execute("SELECT data FROM comments WHERE id = ?", (comment_id,)).fetchone()
+                if comment_row is None:
+                    self.conn.execute("ROLLBACK")
+                    return None
+                comment = json.loads(comment_row[0])
+                vote_row = self.conn.execute("SELECT data FROM comment_votes WHERE id = ?", (key,)).fetchone()
+                existing = json.loads(vote_row[0]) if vote_row else None
+
+                new_type, upvote_delta, downvote_delta = resolve_vote(existing and existing.get("vote_type"), vote_type)
+                upvotes = comment.get("upvotes", 0) + upvote_delta
+                downvotes = comment.get("downvotes", 0) + downvote_delta
+                ranks = comment_ranks(upvotes, downvotes)
+                self.conn.execute(
+                    "UPDATE comments SET score = ?, best = ?, data = json_set(data, "
+                    "'$.upvotes', ?, '$.downvotes', ?, '$.score', ?, '$.best', ?) WHERE id = ?",
+                    (ranks["score"], ranks["best"], upvotes, downvotes, ranks["score"], ranks["best"], comment_id),
+                )
+
+                if new_type is None:
+                    self.conn.execute("DELETE FROM comment_votes WHERE id = ?", (key,))
+                else:
+                    vote = existing or {"id": key, "comment_id": comment_id, "user_id": user_id, "created_at": now}
+                    vote.update({"vote_type": new_type, "updated_at": now})
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO comment_votes (id, comment_id, user_id, data) VALUES (?, ?, ?, ?)",
+                        self._row_values("comment_votes", vote),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return dict(
+            ranks,
+            post_id=comment.get("post_id"),
+            upvotes=upvotes,
+            downvotes=downvotes,
+            upvote_delta=upvote_delta,
+            downvote_delta=downvote_delta,
+        )
+
+    def increment_post_counters(self, deltas):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for post_id, counters in deltas.items():
+                    upvotes, downvotes = counters.get("upvotes", 0), counters.get("downvotes", 0)
+                    self.conn.execute(
+                        "UPDATE posts SET score = score + ?, data = json_set(data, "
+                        "'$.upvotes', coalesce(json_extract(data, '$.upvotes'), 0) + ?, "
+                        "'$.downvotes', coalesce(json_extract(data, '$.downvotes'), 0) + ?, "
+                        "'$.score', coalesce(json_extract(data, '$.score'), 0) + ?) WHERE id = ?",
+                        (upvotes - downvotes, upvotes, downvotes, upvotes - downvotes, post_id),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    # Sharded counters
+    def increment_counter(self, name, shard, amount):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO counter_shards (name, shard, count) VALUES (?, ?, ?) "
+                "ON CONFLICT (name, shard) DO UPDATE SET count = count + excluded.count",
+                (name, shard, amount),
+            )
+
+    def get_counters(self, names, num_shards):
+        names = list(names)
+        totals = dict.fromkeys(names, 0)
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT name, SUM(count) FROM counter_shards WHERE name IN ({placeholders}) GROUP BY name",
+                    chunk,
+                ).fetchall()
+            totals.update(rows)
+        return totals
+
+    def set_counter(self, name, value, num_shards):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("DELETE FROM counter_shards WHERE name = ?", (name,))
+                self.conn.execute("INSERT INTO counter_shards (name, shard, count) VALUES (?, 0, ?)", (name, value))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def fold_counter(self, name, collection, doc_id, field, num_shards):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                (amount,) = self.conn.execute(
+                    "SELECT coalesce(SUM(count), 0) FROM counter_shards WHERE name = ?", (name,)
+                ).fetchone()
+                self.conn.execute("DELETE FROM counter_shards WHERE name = ?", (name,))
+                if amount:
+                    self.conn.execute(
+                        # Nested: older SQLite resolves every json_set path against the input
+                        f"UPDATE {collection} SET data = json_set("
+                        f"json_set(data, '$.{field}', coalesce(json_extract(data, '$.{field}'), 0) + ?, "
+                        f"'$.counter_folds', json(coalesce(json_extract(data, '$.counter_folds'), '{{}}'))), "
+                        f"'$.counter_folds.{field}', coalesce(json_extract(data, '$.counter_folds.{field}'), 0) + 1) "
+                        f"WHERE id = ?",
+                        (amount, doc_id),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return amount
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
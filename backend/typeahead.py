@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+import logging
+import os
+import re
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+logger = logging.getLogger(__name__)
+
+# Seconds between rebuilds from the datastore, which pick up communities
+# created by other workers
+REFRESH_INTERVAL = float(os.environ.get("TYPEAHEAD_REFRESH_INTERVAL", "300"))
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_name(name):
+    """Case- and width-insensitive form of a community name, used for both
+    prefix matching and the duplicate-name check."""
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", name or "").casefold()).strip()
+
+
+class CommunityTypeahead:
+    """Sorted prefix index over normalized community names.
+
+    Each community is indexed under its full name and under every word in
+    it, so "club" finds "Robotics Club". A lookup is a bisect to the first
+    key with the prefix plus a scan of the matching range, keeping the k
+    communities with the most members.
+    """
+
+    def __init__(self, get_storage, refresh_interval=REFRESH_INTERVAL):
+        self.get_storage = get_storage
+        self.refresh_interval = refresh_interval
+        self.keys = []  # sorted (normalized suffix starting at a word, community id)
+        self.communities = {}  # id -> {"id", "name", "member_count"}
+        self.by_name = {}  # normalized full name -> id
+        self.loaded_at = None
+        # Updates made while a reload awaits the datastore, replayed onto the
+        # reloaded index; None when no reload is running
+        self._pending = None
+        self._load_lock = asyncio.Lock()
+        self._task = None
+
+    def _index_keys(self, community_id, normalized):
+        words = normalized.split(" ")
+        return {(" ".join(words[i:]), community_id) for i in range(len(words))}
+
+    def _add_entry(self, community):
+        community_id = community["id"]
+        normalized = normalize_name(community.get("name"))
+        self.communities[community_id] = {
+            "id": community_id,
+            "name": community.get("name"),
+            "member_count": community.get("member_count") or 0,
+            "_normalized": normalized,
+        }
+        self.by_name[normalized] = community_id
+        return self._index_keys(community_id, normalized)
+
+    def add(self, community):
+        if self._pending is not None:
+            self._pending.append((self.add, (community,)))
+        self.remove(community["id"])
+        for key in self._add_entry(community):
+            insort(self.keys, key)
+
+    def load(self, communities):
+        self.keys = []
+        self.communities = {}
+        self.by_name = {}
+        for community in communities:
+            self.keys.extend(self._add_entry(community))
+        self.keys.sort()
+        self.loaded_at = time.monotonic()
+
+    def remove(self, community_id):
+        entry = self.communities.pop(community_id, None)
+        if entry is None:
+            return
+        if self.by_name.get(entry["_normalized"]) == community_id:
+            del self.by_name[entry["_normalized"]]
+        for key in self._index_keys(community_id, entry["_normalized"]):
+            index = bisect_left(self.keys, key)
+            if index < len(self.keys) and self.keys[index] == key:
+                del self.keys[index]
+
+    def set_member_count(self, community_id, member_count):
+        if self._pending is not None:
+            self._pending.append((self.set_member_count, (community_id, member_count)))
+        entry = self.communities.get(community_id)
+        if entry is not None:
+            entry["member_count"] = member_count
+
+    def find_by_name(self, name):
+        """Return the id of a community whose name normalizes like `name`."""
+        return self.by_name.get(normalize_name(name))
+
+    def complete(self, prefix, k=10):
+        prefix = normalize_name(prefix)
+        # An empty prefix matches every key
+        if not prefix:
+            return []
+        start = bisect_left(self.keys, (prefix, ""))
+        matches = set()
+        keys = self.keys
+        for index in range(start, len(keys)):
+            key, community_id = keys[index]
+            if not key.startswith(prefix):
+                break
+            matches.add(community_id)
+        top = heapq.nlargest(k, matches, key=lambda community_id: (self.communities[community_id]["member_count"], community_id))
+        return [
+            {"id": community_id, "name": self.communities[community_id]["name"], "member_count": self.communities[community_id]["member_count"]}
+            for community_id in top
+        ]
+
+    async def ensure_loaded(self):
+        """Build the index on first use; rebuilds after that happen in the
+        background task, off the request path."""
+        if self.loaded_at is not None:
+            return
+        async with self._load_lock:
+            if self.loaded_at is None:
+                await self._reload()
+
+    async def refresh(self):
+        async with self._load_lock:
+            await self._reload()
+
+    async def _reload(self):
+        # Member counts as of the last fold; a ranking hint, not a display value
+        self._pending = []
+        try:
+            communities = await self.get_storage().list_communities()
+        finally:
+            pending, self._pending = self._pending, None
+        self.load(communities)
+        for update, args in pending:
+            update(*args)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            if self.loaded_at is None:
+                continue
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Typeahead refresh failed; serving the previous index")
+
+    def start(self):
+        if self.refresh_interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {"communities": len(self.communities), "keys": len(self.keys)}
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds between flushes; 0 disables buffering and /vote writes counters
+# in its own transaction
+FLUSH_INTERVAL = float(os.environ.get("VOTE_FLUSH_INTERVAL", "1.0"))
+# Flush early once this many posts have pending deltas
+MAX_PENDING_POSTS = int(os.environ.get("VOTE_MAX_PENDING_POSTS", "500"))
+
+
+class VoteAggregator:
+    """Write-behind buffer for post vote counters.
+
+    /vote still records each user's vote immediately, but the resulting
+    upvote/downvote deltas are summed per post here and written out in one
+    batched increment per flush, so a hot post sees one counter write per
+    interval instead of one per click.
+    """
+
+    def __init__(self, get_storage, flush_interval=FLUSH_INTERVAL, max_pending_posts=MAX_PENDING_POSTS, on_flush=None):
+        self.get_storage = get_storage
+        # Called with the ids of the posts whose counters a flush wrote
+        self.on_flush = on_flush
+        self.flush_interval = flush_interval
+        self.max_pending_posts = max_pending_posts
+        self.pending = {}
+        # The batch being written; still counted by pending_for until it commits
+        self.in_flight = {}
+        self._task = None
+        # Early flushes started by add(), held so they aren't garbage collected
+        self._early_flushes = set()
+        self._flush_lock = asyncio.Lock()
+        self._stats = {
+            "votes_buffered": 0,
+            "flushes": 0,
+            "flush_failures": 0,
+            "posts_flushed": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    @property
+    def enabled(self):
+        return self.flush_interval > 0
+
+    def add(self, post_id, upvote_delta, downvote_delta):
+        if not upvote_delta and not downvote_delta:
+            return
+        counters = self.pending.setdefault(post_id, {"upvotes": 0, "downvotes": 0})
+        counters["upvotes"] += upvote_delta
+        counters["downvotes"] += downvote_delta
+        self._stats["votes_buffered"] += 1
+        if len(self.pending) >= self.max_pending_posts and not self._flush_lock.locked():
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._early_flushes.add(task)
+            task.add_done_callback(self._early_flushes.discard)
+
+    def pending_for(self, post_id):
+        upvotes = downvotes = 0
+        for counters in (self.pending.get(post_id), self.in_flight.get(post_id)):
+            if counters is not None:
+                upvotes += counters["upvotes"]
+                downvotes += counters["downvotes"]
+        return upvotes, downvotes
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            batch = {
+                post_id: counters
+                for post_id, counters in batch.items()
+                if counters["upvotes"] or counters["downvotes"]
+            }
+            if not batch:
+                return
+            self.in_flight = batch
+            started = time.perf_counter()
+            try:
+                await self.get_storage().increment_post_counters(batch)
+            except Exception:
+                self.in_flight = {}
+                # Put the deltas back so the next flush retries them
+                self._stats["flush_failures"] += 1
+                for post_id, counters in batch.items():
+                    merged = self.pending.setdefault(post_id, {"upvotes": 0, "downvotes": 0})
+                    merged["upvotes"] += counters["upvotes"]
+                    merged["downvotes"] += counters["downvotes"]
+                logger.exception("Vote counter flush failed; %d posts re-queued", len(batch))
+                return
+            # Committed: the deltas are in the documents now
+            self.in_flight = {}
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if self.on_flush is not None:
+                self.on_flush(list(batch))
+            self._stats["flushes"] += 1
+            self._stats["posts_flushed"] += len(batch)
+            self._stats["last_flush_ms"] = round(elapsed_ms, 2)
+            self._stats["max_flush_ms"] = round(max(self._stats["max_flush_ms"], elapsed_ms), 2)
+            self._stats["total_flush_ms"] += elapsed_ms
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        # Flush-on-shutdown: nothing buffered is lost on a clean stop
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._early_flushes:
+            await asyncio.gather(*self._early_flushes, return_exceptions=True)
+        await self.flush()
+
+    def stats(self):
+        flushes = self._stats["flushes"]
+        return {
+            "enabled": self.enabled,
+            "pending_posts": len(self.pending),
+            "in_flight_posts": len(self.in_flight),
+            "pending_votes": sum(abs(c["upvotes"]) + abs(c["downvotes"]) for c in self.pending.values()),
+            "votes_buffered": self._stats["votes_buffered"],
+            "flushes": flushes,
+            "flush_failures": self._stats["flush_failures"],
+            "posts_flushed": self._stats["posts_flushed"],
+            "last_flush_ms": self._stats["last_flush_ms"],
+            "max_flush_ms": self._stats["max_flush_ms"],
+            "avg_flush_ms": round(self._stats["total_flush_ms"] / flushes, 2) if flushes else 0.0,
+        }
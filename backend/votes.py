@@ -0,0 +1,40 @@
+from collections import defaultdict
+
+from backend.storage.base import vote_key
+
+
+def rekey_votes(storage):
+    """Move votes stored under random ids to vote_key(post_id, user_id), which
+    apply_vote reads. Where a user has several votes on one post the latest
+    is kept and the others are taken back off the post's counters. Safe to
+    re-run. Returns (moved, removed)."""
+    by_key = defaultdict(list)
+    for vote in storage.list_votes():
+        by_key[vote_key(vote["post_id"], vote["user_id"])].append(vote)
+
+    moved = removed = 0
+    deltas = defaultdict(lambda: {"upvotes": 0, "downvotes": 0})
+    for key, votes in by_key.items():
+        if len(votes) == 1 and votes[0]["id"] == key:
+            continue
+        votes.sort(key=lambda vote: vote.get("updated_at") or vote.get("created_at") or "")
+        keep = votes[-1]
+        for extra in votes[:-1]:
+            # Every vote document was counted once when it was cast
+            if extra.get("vote_type") in ("upvote", "downvote"):
+                deltas[extra["post_id"]][extra["vote_type"] + "s"] -= 1
+            removed += 1
+        storage.replace_votes({**keep, "id": key}, [vote["id"] for vote in votes if vote["id"] != key])
+        moved += 1
+
+    if deltas:
+        storage.increment_post_counters(dict(deltas))
+    return moved, removed
+
+
+if __name__ == "__main__":
+    # python -m backend.votes: re-key legacy votes; run before serving traffic
+    from backend.database import get_storage
+
+    moved, removed = rekey_votes(get_storage())
+    print(f"Re-keyed {moved} votes, removed {removed} duplicates")
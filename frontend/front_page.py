@@ -93,24 +93,39 @@ with left_column:
     # My Communities section
     st.subheader("My Communities")
     try:
-        response = requests.get("http://127.0.0.1:8000/get_communities")
-        if response.status_code == 200:
-            communities = response.json()[:5]  # Just showing first 5 for demo
-            
-            for community in communities:
-                community_id = community.get("id", None)  # Safely get ID
-                community_name = community.get("name", "Unknown")
+        if not st.session_state.get('token'):
+            st.write("Sign in to see your communities")
+            communities = []
+        else:
+            response = requests.get(
+                "http://127.0.0.1:8000/my_communities",
+                params={"limit": 5},
+                headers={"Authorization": f"Bearer {st.session_state['token']}"}
+            )
+            if response.status_code == 200:
+                communities = response.json().get("communities", [])
+                if not communities:
+                    st.write("You haven't joined any communities yet")
+            else:
+                communities = []
+                st.error("Failed to load communities")
+        
+        for community in communities:
+            community_id = community.get("id", None)  # Safely get ID
+            community_name = community.get("name", "Unknown")
 
-                if community_id is None:
-                    st.warning(f"Skipping community '{community_name}' due to missing ID.")
-                    continue  # Skip this iteration if ID is missing
+            if community_id is None:
+                st.warning(f"Skipping community '{community_name}' due to missing ID.")
+                continue  # Skip this iteration if ID is missing
 
-                if st.button(f"c/{community_name}", key=f"community_{community_id}"):
-                    # Store selected community in session state
-                    st.session_state['selected_community'] = community_id
-                    st.switch_page("community_view.py")  # Redirect to community view
-        else:
-            st.error("Failed to load communities")
+            unread = community.get("unread_count", 0)
+            label = f"c/{community_name} ({unread} new)" if unread else f"c/{community_name}"
+            if st.button(label, key=f"community_{community_id}"):
+                # Store selected community in session state
+                st.session_state['selected_community'] = community_id
+                # A new visit, so the community gets marked as read again
+                st.session_state.setdefault('marked_read', set()).discard(community_id)
+                st.switch_page("community_view.py")  # Redirect to community view
     except requests.exceptions.RequestException:
         st.write("No communities to display")
 
@@ -141,10 +156,15 @@ with main_column:
     
     try:
         # Fetching posts from the backend
-        response = requests.get("http://127.0.0.1:8000/get_posts")
+        # Backend serves precomputed rankings for the selected sort and time window
+        windows = {"Today": "day", "This Week": "week", "This Month": "month", "All Time": "all"}
+        response = requests.get(
+            "http://127.0.0.1:8000/feed",
+            params={"sort": sort_by.lower(), "window": windows[time_filter], "limit": 25},
+        )
         
         if response.status_code == 200:
-            posts = response.json()
+            posts = response.json().get("posts", [])
             
             if not posts:
                 st.info("No posts yet! Be the first to create one.")
@@ -159,43 +179,36 @@ with main_column:
                 with vote_col:
                     
                     post_id = str(post.get('id', ''))  # Ensure it's a string
-                    user_id = str(st.session_state.get('user_id', ''))  # Ensure it's a string
+                    token = st.session_state.get('token')
+                    auth_headers = {"Authorization": f"Bearer {token}"}
 
-                    if not post_id or not user_id:
+                    if not post_id or not token:
                         st.warning("Log  in to  vote")
                     else:
-                        # Upvote Button
-                        if st.button("⬆️", key=f"upvote_{post_id}"):
+                        upvoted = st.button("⬆️", key=f"upvote_{post_id}")
+                        # Upvote count, filled in once a vote has been handled
+                        upvote_count = st.empty()
+                        downvoted = st.button("⬇️", key=f"downvote_{post_id}")
+
+                        # /vote returns the post's new counts, so show them here
+                        # rather than rerunning the page and refetching the feed
+                        vote_type = "upvote" if upvoted else "downvote" if downvoted else None
+                        if vote_type:
                             try:
                                 response = requests.post(
                                     "http://127.0.0.1:8000/vote",
-                                    json={"post_id": post_id, "user_id": user_id, "vote_type": "upvote"}
+                                    json={"post_id": post_id, "vote_type": vote_type},
+                                    headers=auth_headers
                                 )
-                                st.write(response.json())  # Debugging - Show API response
                                 if response.status_code == 200:
-                                    st.experimental_rerun()
+                                    post.update(response.json())
                                 else:
-                                    st.error(f"Failed to upvote: {response.text}")  # Show error message
+                                    st.error(f"Failed to {vote_type}: {response.text}")  # Show error message
                             except requests.exceptions.RequestException as e:
                                 st.error(f"Error connecting to the server: {e}")
 
                         # Display Upvote Count
-                        st.markdown(f'<div class="upvote-count">{post.get("upvotes", 0)}</div>', unsafe_allow_html=True)
-
-                        # Downvote Button
-                        if st.button("⬇️", key=f"downvote_{post_id}"):
-                            try:
-                                response = requests.post(
-                                    "http://127.0.0.1:8000/vote",
-                                    json={"post_id": post_id, "user_id": user_id, "vote_type": "downvote"}
-                                )
-                                st.write(response.json())  # Debugging - Show API response
-                                if response.status_code == 200:
-                                    st.experimental_rerun()
-                                else:
-                                    st.error(f"Failed to downvote: {response.text}")  # Show error message
-                            except requests.exceptions.RequestException as e:
-                                st.error(f"Error connecting to the server: {e}")
+                        upvote_count.markdown(f'<div class="upvote-count">{post.get("upvotes", 0)}</div>', unsafe_allow_html=True)
 
                 with content_col:
                     # Community badge and post metadata
@@ -209,12 +222,10 @@ with main_column:
                     # Post title with link
                     st.markdown(f'<div class="post-title">{post.get("title", "Untitled Post")}</div>', unsafe_allow_html=True)
                     
-                    # Post content - truncated if too long
-                    content = post.get("content", "")
+                    # Post content - the backend sends a truncated preview
+                    content = post.get("preview", post.get("content", ""))
                     if content is None:
                         content = ""
-                    if len(content) > 300:
-                        content = content[:300] + "..."
                     st.write(content)
                     
                     # Post actions
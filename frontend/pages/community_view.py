@@ -91,10 +91,11 @@ left_column, main_column = st.columns([1, 3])
 
 # Try to fetch community data
 try:
-    # In a real app, fetch from your backend
-    response = requests.get(f"http://127.0.0.1:8000/get_community/{community_id}")
-    if response.status_code == 200:
-        community = response.json()
+    # The backend has no single-community getter; a one-id batch get does the same job
+    response = requests.post("http://127.0.0.1:8000/communities:batchGet", json={"ids": [community_id]})
+    communities = response.json().get("communities", []) if response.status_code == 200 else []
+    if communities:
+        community = communities[0]
     else:
         st.error("Failed to load community data")
         community = None
@@ -201,11 +202,31 @@ with main_column:
     st.markdown("### Posts")
     
     try:
-        # Fetching posts for this community from the backend
-        response = requests.get(f"http://127.0.0.1:8000/get_community_posts/{community_id}")
+        # Fetching posts for this community from the backend. Streamlit reruns
+        # this page on every interaction, so the last response is kept and
+        # revalidated with its ETag; an unchanged list comes back as a bare 304
+        cached = st.session_state.setdefault('community_posts_cache', {}).get(community_id)
+        headers = {"If-None-Match": cached["etag"]} if cached else {}
+        response = requests.get(f"http://127.0.0.1:8000/get_community_posts/{community_id}", headers=headers)
         
-        if response.status_code == 200:
-            posts = response.json()
+        if response.status_code in (200, 304):
+            if response.status_code == 304:
+                posts = cached["posts"]
+            else:
+                posts = response.json()
+                if response.headers.get("ETag"):
+                    st.session_state['community_posts_cache'][community_id] = {"etag": response.headers["ETag"], "posts": posts}
+            
+            # Viewing the community clears its unread count in the sidebar,
+            # once per visit rather than on every rerun of this page
+            marked_read = st.session_state.setdefault('marked_read', set())
+            if st.session_state.get('token') and community_id not in marked_read:
+                read_response = requests.post(
+                    f"http://127.0.0.1:8000/communities/{community_id}/read",
+                    headers={"Authorization": f"Bearer {st.session_state['token']}"}
+                )
+                if read_response.status_code == 200:
+                    marked_read.add(community_id)
             
             if not posts:
                 st.info(f"No posts in this community yet! Be the first to create one.")
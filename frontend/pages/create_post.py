@@ -43,20 +43,29 @@ if st.button("← Back to Home"):
 
 st.markdown('<div class="form-container">', unsafe_allow_html=True)
 
-# Get available communities from backend
+# Look up communities by name instead of downloading all of them
+community_query = st.text_input("Search communities", placeholder="Start typing a community name")
 try:
-    response = requests.get("http://127.0.0.1:8000/get_communities")
+    response = requests.get("http://127.0.0.1:8000/communities/typeahead", params={"q": community_query, "k": 20})
     if response.status_code == 200:
         communities = response.json()
-        community_names = [f"c/{comm['name']}" for comm in communities]
         
-        # Use default community if coming from a specific community page
+        # Use default community if coming from a specific community page. It
+        # may not be among the matches, so look it up once and keep it first
         default_idx = 0
-        if 'selected_community' in st.session_state:
-            for i, comm in enumerate(communities):
-                if comm['id'] == st.session_state['selected_community']:
-                    default_idx = i
-                    break
+        preselected_id = st.session_state.get('selected_community')
+        if preselected_id:
+            preselected = st.session_state.get('preselected_community')
+            if not preselected or preselected['id'] != preselected_id:
+                lookup = requests.post("http://127.0.0.1:8000/communities:batchGet", json={"ids": [preselected_id]})
+                found = lookup.json().get("communities", []) if lookup.status_code == 200 else []
+                preselected = {"id": found[0]["id"], "name": found[0]["name"]} if found else None
+                st.session_state['preselected_community'] = preselected
+            if preselected:
+                communities = [preselected] + [comm for comm in communities if comm['id'] != preselected_id]
+        if not communities:
+            st.info("No communities match your search")
+        community_names = [f"c/{comm['name']}" for comm in communities]
         
         selected_community = st.selectbox(
             "Choose a community",
@@ -65,7 +74,7 @@ try:
         )
         
         # Extract the community ID for the selected community
-        selected_community_name = selected_community.replace("c/", "")
+        selected_community_name = (selected_community or "").replace("c/", "")
         selected_community_id = next((comm['id'] for comm in communities if comm['name'] == selected_community_name), None)
     else:
         st.error("Failed to fetch communities")
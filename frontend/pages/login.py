@@ -60,7 +60,9 @@ with center_col:
                     user_data = response.json()
                     st.session_state['logged_in'] = True
                     st.session_state['username'] = user_data.get('username', email.split('@')[0])
-                    st.session_state['user_id'] = user_data.get('user_id')
+                    st.session_state['user_id'] = user_data.get('user_id') or user_data.get('id')
+                    st.session_state['token'] = user_data.get('access_token')
+                    st.session_state['email'] = user_data.get('email', email)
                     
                     st.success("Login successful!")
                     st.switch_page("front_page")  # Redirect to front page
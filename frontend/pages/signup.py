@@ -60,6 +60,18 @@ with center_col:
     if email and not email.endswith('@rajalakshmi.edu.in'):
         st.markdown('<p class="error-text">Only @rajalakshmi.edu.in email addresses are allowed</p>', unsafe_allow_html=True)
     
+    # Tell the user as soon as they type a name or email that's taken
+    if username or email:
+        try:
+            params = {key: value for key, value in (("username", username), ("email", email)) if value}
+            availability = requests.get("http://127.0.0.1:8000/availability", params=params, timeout=2).json()
+            if not availability.get("username", {}).get("available", True):
+                st.markdown('<p class="error-text">Username already taken</p>', unsafe_allow_html=True)
+            if not availability.get("email", {}).get("available", True):
+                st.markdown('<p class="error-text">Email already registered</p>', unsafe_allow_html=True)
+        except (requests.exceptions.RequestException, ValueError):
+            pass  # The register call still checks
+    
     password = st.text_input("Password", type="password")
     confirm_password = st.text_input("Confirm Password", type="password")
     
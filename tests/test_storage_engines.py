@@ -0,0 +1,115 @@
+"""Contract tests every synchronous StorageEngine must pass."""
+import pytest
+
+from backend.storage import ConflictError
+from backend.storage.memory_engine import MemoryStorage
+from backend.storage.sqlite_engine import SQLiteStorage
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "memory":
+        engine = MemoryStorage()
+    else:
+        engine = SQLiteStorage(str(tmp_path / "campus.db"))
+    yield engine
+    engine.close()
+
+
+def _post(post_id, created_at, score=0, community_id="c1"):
+    return {
+        "id": post_id,
+        "title": post_id,
+        "community_id": community_id,
+        "created_at": created_at,
+        "upvotes": max(score, 0),
+        "downvotes": max(-score, 0),
+        "score": score,
+        "comment_count": 0,
+    }
+
+
+def _pages(storage, order_by, limit, **kwargs):
+    pages, after = [], None
+    while True:
+        page = storage.list_posts_page(order_by, limit, after=after, **kwargs)
+        if not page:
+            return pages
+        pages.append([post["id"] for post in page])
+        last = page[-1]
+        after = [last[order_by], last["id"]]
+
+
+def test_posts_page_newest_first(storage):
+    for i in range(7):
+        storage.create_post(_post(f"p{i}", f"2025-01-0{i + 1}"))
+    assert _pages(storage, "created_at", 3) == [["p6", "p5", "p4"], ["p3", "p2", "p1"], ["p0"]]
+
+
+def test_posts_page_by_score_and_community(storage):
+    for i, score in enumerate([3, -1, 3, 0, 5]):
+        storage.create_post(_post(f"p{i}", "2025-01-01", score, community_id="c1" if i % 2 == 0 else "c2"))
+    assert _pages(storage, "score", 2) == [["p4", "p2"], ["p0", "p3"], ["p1"]]
+    assert _pages(storage, "score", 2, community_id="c2") == [["p3", "p1"]]
+
+
+def test_posts_page_follows_votes(storage):
+    storage.create_post(_post("a", "2025-01-01"))
+    storage.create_post(_post("b", "2025-01-02"))
+    storage.apply_vote("a", "u1", "upvote", "now")
+    assert [post["id"] for post in storage.list_posts_page("score", 10)] == ["a", "b"]
+    storage.apply_vote("a", "u1", "downvote", "now")
+    assert [post["id"] for post in storage.list_posts_page("score", 10)] == ["b", "a"]
+
+
+def test_apply_vote_toggle_and_switch(storage):
+    storage.create_post(_post("p", "2025-01-01"))
+    first = storage.apply_vote("p", "u1", "upvote", "t1")
+    assert (first["upvotes"], first["downvotes"]) == (1, 0)
+    assert storage.get_vote("p", "u1")["vote_type"] == "upvote"
+
+    switched = storage.apply_vote("p", "u1", "downvote", "t2")
+    assert (switched["upvotes"], switched["downvotes"]) == (0, 1)
+    assert (switched["upvote_delta"], switched["downvote_delta"]) == (-1, 1)
+
+    removed = storage.apply_vote("p", "u1", "downvote", "t3")
+    assert (removed["upvotes"], removed["downvotes"]) == (0, 0)
+    assert storage.get_vote("p", "u1") is None
+    assert storage.get_post("p")["score"] == 0
+
+
+def test_apply_vote_unknown_post(storage):
+    assert storage.apply_vote("missing", "u1", "upvote", "t1") is None
+
+
+def test_reservations_conflict(storage):
+    storage.create_user({"id": "u1", "email": "Ann@Example.com", "username": "ann"})
+    with pytest.raises(ConflictError) as excinfo:
+        storage.create_user({"id": "u2", "email": "ann@example.com ", "username": "other"})
+    assert excinfo.value.field == "email"
+    with pytest.raises(ConflictError) as excinfo:
+        storage.create_user({"id": "u3", "email": "b@example.com", "username": "ANN"})
+    assert excinfo.value.field == "username"
+    assert storage.get_user("u2") is None
+    # Re-writing the holder's own document is not a conflict
+    storage.create_user({"id": "u1", "email": "ann@example.com", "username": "ann"})
+
+
+def test_fold_counter_moves_shards_into_document(storage):
+    storage.create_post(_post("p", "2025-01-01"))
+    storage.increment_counter("posts:p:comment_count", 0, 2)
+    storage.increment_counter("posts:p:comment_count", 3, 1)
+    assert storage.fold_counter("posts:p:comment_count", "posts", "p", "comment_count", 10) == 3
+    post = storage.get_post("p")
+    assert post["comment_count"] == 3
+    assert post["counter_folds"] == {"comment_count": 1}
+    assert storage.get_counters(["posts:p:comment_count"], 10) == {"posts:p:comment_count": 0}
+    # Nothing to fold leaves the generation alone
+    assert storage.fold_counter("posts:p:comment_count", "posts", "p", "comment_count", 10) == 0
+    assert storage.get_post("p")["counter_folds"] == {"comment_count": 1}
+
+
+def test_list_users_fields(storage):
+    storage.create_user({"id": "u1", "email": "ann@example.com", "username": "ann", "password": "hash"})
+    users = storage.list_users(fields=["email", "username"])
+    assert users == [{"id": "u1", "email": "ann@example.com", "username": "ann"}]